@@ -0,0 +1,4 @@
+# The ASGI app over loadapp (CSRF off, /_prime). Serve it from the app directory:
+#   GUNICORN_APP=asgiapp:app GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn -c gunicorn.conf.py --pythonpath bench
+import loadapp
+from divcalc_asgi import app
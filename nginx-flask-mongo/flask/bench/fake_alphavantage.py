@@ -0,0 +1,109 @@
+# Local stand-in for the AlphaVantage query endpoint, for benchmarks and load tests.
+#   python bench/fake_alphavantage.py [port]        (default 8765)
+#   ALPHAVANTAGE_URL=http://127.0.0.1:8765/query    for the app
+# Control endpoints:
+#   /_counts                calls per function so far, JSON
+#   /_reset                 zero the counters
+#   /_delay?GLOBAL_QUOTE=0.5  seconds added to a function, * for all of them
+# The symbol NONE has no overview, like an unknown ticker
+import sys
+import json
+import time
+import datetime
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+counts = {}
+delays = {}
+lock = threading.Lock()
+
+
+def dividends(symbol, n=140):
+    # Quarterly, newest first, amounts growing over time
+    data = []
+    for i in range(n):
+        month = 4 - 3 * i
+        pay = datetime.date(2025 + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+        data.append({'ex_dividend_date': str(pay - datetime.timedelta(days=20)),
+                     'declaration_date': str(pay - datetime.timedelta(days=40)),
+                     'record_date': str(pay - datetime.timedelta(days=19)),
+                     'payment_date': str(pay),
+                     'amount': f'{0.51 - i * 0.002:.4f}'})
+    return {'symbol': symbol, 'data': data}
+
+
+def dailySeries(compact):
+    # Weekdays 1995-01-02 .. 2025-06-01 on a slow linear climb
+    start = datetime.date(1995, 1, 2)
+    series = {}
+    for i in range(11000):
+        day = start + datetime.timedelta(days=i)
+        if day.weekday() < 5 and day <= datetime.date(2025, 6, 1):
+            close = 20 + i * 0.004
+            series[str(day)] = {'1. open': f'{close:.4f}', '4. close': f'{close + .1:.4f}'}
+    days = sorted(series, reverse=True)
+    if compact:
+        days = days[:100]
+    return {'Meta Data': {}, 'Time Series (Daily)': {d: series[d] for d in days}}
+
+
+def payload(function, query):
+    symbol = (query.get('symbol') or query.get('tickers') or [''])[0]
+    if function == 'OVERVIEW':
+        if symbol == 'NONE':
+            return {}
+        return {'Symbol': symbol, 'Name': symbol + ' Corp', 'Description': 'Fake', 'OfficialSite': 'x', 'Sector': 'S',
+                'Industry': 'I', 'Exchange': 'NYSE', 'DividendYield': '0.03', 'AnalystTargetPrice': '70',
+                'BookValue': '5.5', 'Beta': '0.6'}
+    if function == 'GLOBAL_QUOTE':
+        return {'Global Quote': {'01. symbol': symbol, '05. price': '61.25'}}
+    if function == 'DIVIDENDS':
+        return dividends(symbol)
+    if function == 'NEWS_SENTIMENT':
+        return {'feed': [{'title': f't{i}', 'ticker_sentiment': [{'ticker': symbol, 'ticker_sentiment_score': '0.2'}]}
+                         for i in range(50)]}
+    if function == 'TIME_SERIES_DAILY':
+        return dailySeries(query.get('outputsize', ['compact'])[0] == 'compact')
+    if function == 'MARKET_STATUS':
+        return {'markets': []}
+    return {'Error Message': 'Invalid API call'}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/_counts':
+            with lock:
+                body = json.dumps(counts).encode()
+        elif url.path == '/_reset':
+            with lock:
+                counts.clear()
+            body = b'{}'
+        elif url.path == '/_delay':
+            for function, seconds in query.items():
+                delays[function] = float(seconds[0])
+            body = b'{}'
+        else:
+            function = query.get('function', [''])[0]
+            with lock:
+                counts[function] = counts.get(function, 0) + 1
+            time.sleep(delays.get(function, delays.get('*', 0)))
+            body = json.dumps(payload(function, query)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == '__main__':
+    ThreadingHTTPServer.daemon_threads = True
+    ThreadingHTTPServer.request_queue_size = 1024
+    ThreadingHTTPServer(('127.0.0.1', int(sys.argv[1]) if len(sys.argv) > 1 else 8765), Handler).serve_forever()
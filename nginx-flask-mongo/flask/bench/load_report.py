@@ -0,0 +1,61 @@
+# Closed loop load on / and /report: conc keep-alive clients for dur seconds each, after a 1s warmup
+#   python bench/fake_alphavantage.py &
+#   GUNICORN_APP=loadapp:app gunicorn -c gunicorn.conf.py --pythonpath bench &
+#   python bench/load_report.py port conc dur
+import sys
+import time
+import threading
+import http.client
+import urllib.parse
+
+port, conc, dur = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3])
+
+form = urllib.parse.urlencode(dict(stock_symbol='KO', share_price='60', shares_owned='1', distribution='0.51', term='30',
+                                   frequency='Monthly', contribution='100', volatility='0', purchase_mode='Fractional',
+                                   engine='Vectorized', initial_capital='1000'))
+
+
+def client(path, results, stop):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/_prime')
+    response = conn.getresponse()
+    response.read()
+    headers = {'Cookie': response.getheader('Set-Cookie').split(';')[0],
+               'Content-Type': 'application/x-www-form-urlencoded'}
+    conn.request('POST', '/search', body='stock_symbol=KO', headers=headers)
+    conn.getresponse().read()
+
+    latencies = []
+    results.append(latencies)
+    while not stop.is_set():
+        t = time.perf_counter()
+        if path == '/report':
+            conn.request('POST', path, body=form, headers=headers)
+        else:
+            conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            print('status', response.status)
+            break
+        if response.getheader('Connection', '').lower() == 'close' or response.version == 10:
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        latencies.append(time.perf_counter() - t)
+
+
+for path in ('/', '/report'):
+    results, stop = [], threading.Event()
+    threads = [threading.Thread(target=client, args=(path, results, stop)) for _ in range(conc)]
+    for thread in threads:
+        thread.start()
+    time.sleep(1.0)
+    for latencies in results:
+        latencies.clear()
+    time.sleep(dur)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    done = sorted(l for latencies in results for l in latencies)
+    print(f'{path:8s} conc {conc}: {len(done) / dur:7.1f} req/s, p50 {done[len(done) // 2] * 1e3:6.1f} ms, '
+          f'p99 {done[int(len(done) * .99)] * 1e3:6.1f} ms')
@@ -0,0 +1,77 @@
+# Closed loop search load: conc keep-alive clients POST never-seen symbols, so every search goes
+# upstream. Measured for dur seconds after a 10s warmup. path is /search or /api/search
+#   python bench/fake_alphavantage.py &
+#   curl '127.0.0.1:8765/_delay?*=0.3'
+#   GUNICORN_APP=asgiapp:app GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn -c gunicorn.conf.py --pythonpath bench &
+#   python bench/load_search.py port conc dur path
+# Serve loadapp:app with the default gthread workers for the sync numbers
+import sys
+import time
+import asyncio
+import itertools
+
+port, conc, dur, path = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3]), sys.argv[4]
+ids = itertools.count()
+run = str(time.time_ns())[-6:]
+
+
+async def request(reader, writer, method, target, body=b'', headers=()):
+    # Minimal HTTP/1.1 client, returns (status, cookie) and drains the body
+    head = [f'{method} {target} HTTP/1.1', 'Host: bench', f'Content-Length: {len(body)}', *headers]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+    status = int((await reader.readline()).split()[1])
+    length, chunked, cookie = 0, False, None
+    while (line := await reader.readline()) != b'\r\n':
+        name, _, value = line.decode().partition(':')
+        name, value = name.lower(), value.strip()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'set-cookie':
+            cookie = value.split(';')[0]
+    if chunked:
+        while (size := int((await reader.readline()).strip(), 16)):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    else:
+        await reader.readexactly(length)
+    return status, cookie
+
+
+async def client(latencies, stop):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=2**20)
+    _, cookie = await request(reader, writer, 'GET', '/_prime')
+    while not stop.is_set():
+        symbol = f'S{run}{next(ids)}'
+        if path == '/search':
+            body = f'stock_symbol={symbol}'.encode()
+            headers = [f'Cookie: {cookie}', 'Content-Type: application/x-www-form-urlencoded']
+        else:
+            body = f'{{"symbol": "{symbol}", "api_key": "bench"}}'.encode()
+            headers = ['Content-Type: application/json']
+        t = time.perf_counter()
+        status, _ = await request(reader, writer, 'POST', path, body, headers)
+        if status != 200:
+            print('status', status)
+            break
+        latencies.append((time.perf_counter(), time.perf_counter() - t))
+
+
+async def main():
+    latencies, stop = [], asyncio.Event()
+    tasks = [asyncio.create_task(client(latencies, stop)) for _ in range(conc)]
+    await asyncio.sleep(10)
+    start = time.perf_counter()
+    await asyncio.sleep(dur)
+    stop.set()
+    end = time.perf_counter()
+    await asyncio.wait(tasks, timeout=60)
+
+    done = sorted(l for t, l in latencies if start <= t <= end)
+    rate = len(done) / dur
+    mean = sum(done) / len(done)
+    print(f'{path:11s} conc {conc:4d}: {rate:6.1f} searches/s, p50 {done[len(done) // 2] * 1e3:7.0f} ms, '
+          f'p99 {done[int(len(done) * .99)] * 1e3:7.0f} ms, in flight ~{rate * mean:5.0f}')
+
+asyncio.run(main())
@@ -0,0 +1,24 @@
+# Load test app: CSRF off and a /_prime route that sets up a session like login + settings would.
+# Serve it with the real config from the app directory:
+#   GUNICORN_APP=loadapp:app gunicorn -c gunicorn.conf.py --pythonpath bench
+import os
+import sys
+
+app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_dir)
+os.environ.setdefault('ALPHAVANTAGE_URL', 'http://127.0.0.1:8765/query')
+
+import divcalc_server
+from flask import session
+
+app = divcalc_server.app
+app.config['WTF_CSRF_ENABLED'] = False
+
+@app.route('/_prime')
+def prime():
+    session.update(username='bench', api_src='AlphaVantage', api_key='bench', initial_capital=None, shares_owned=None,
+                   term=None, frequency=None, contribution=None, purchase_mode=None)
+    return 'ok'
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=int(os.environ.get('FLASK_SERVER_PORT', 9090)), debug=False, use_reloader=False)
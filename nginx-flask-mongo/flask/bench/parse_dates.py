@@ -0,0 +1,42 @@
+# DataModel.getData over a synthetic 500 record monthly dividend history, the
+# AlphaVantage calls stubbed in process so only parsing and model building count.
+#   python bench/parse_dates.py [runs]
+# Run it on the parent commit of a change for the before figure
+import os
+import sys
+import time
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import divcalc_api
+from divcalc_data import DataModel
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+start = datetime.date(2025, 6, 1)
+history = []
+for i in range(500):
+    pay = start - datetime.timedelta(days=30 * i)
+    history.append({'ex_dividend_date': str(pay - datetime.timedelta(days=20)),
+                    'declaration_date': str(pay - datetime.timedelta(days=40)),
+                    'record_date': str(pay - datetime.timedelta(days=19)),
+                    'payment_date': str(pay), 'amount': '0.1'})
+overview = {'Name': 'n', 'Description': 'd', 'OfficialSite': 'o', 'Sector': 's', 'Industry': 'i', 'Exchange': 'e',
+            'DividendYield': '0.03', 'AnalystTargetPrice': '1', 'BookValue': '1', 'Beta': '1'}
+
+divcalc_api.AlphaVantage.getOverview = lambda self, symbol: overview
+divcalc_api.AlphaVantage.getDividendHistory = lambda self, symbol: history
+divcalc_api.AlphaVantage.getQuote = lambda self, symbol: {'05. price': '10'}
+divcalc_api.AlphaVantage.getNewsSentiment = lambda self, symbol: {'feed': []}
+
+config = {'api_src': 'AlphaVantage', 'api_key': 'bench'}
+DataModel().getData(config, 'KO')
+
+t = time.perf_counter()
+for _ in range(runs):
+    data_model = DataModel()
+    data_model.getData(config, 'KO')
+elapsed = (time.perf_counter() - t) / runs
+print(f'getData, {len(history)} dividends: {elapsed * 1e3:.2f} ms mean over {runs} runs, '
+      f'{len(data_model.dividend_history)} parsed, frequency {data_model.dividend_frequency}')
@@ -0,0 +1,55 @@
+# Time to first byte, total time and peak traced memory for /report at 10/50/100 years monthly
+#   python bench/fake_alphavantage.py &
+#   python bench/report_stream.py [Loop|Vectorized]
+import os
+import sys
+import time
+import tracemalloc
+
+app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_dir)
+os.chdir(app_dir)
+os.environ.setdefault('ALPHAVANTAGE_URL', 'http://127.0.0.1:8765/query')
+os.environ.setdefault('DIVCALC_SESSION', 'memory')
+
+import divcalc_data
+import divcalc_server
+
+engine = sys.argv[1] if len(sys.argv) > 1 else 'Loop'
+runs = 32
+
+app = divcalc_server.app
+app.config['WTF_CSRF_ENABLED'] = False
+client = app.test_client()
+with client.session_transaction() as s:
+    s.update(username='bench', api_src='AlphaVantage', api_key='bench', initial_capital=None, shares_owned=None,
+             term=None, frequency=None, contribution=None, purchase_mode=None)
+response = client.post('/search', data={'stock_symbol': 'KO'})
+assert response.status_code == 200, response.status_code
+
+for term in (10, 50, 100):
+    form = dict(stock_symbol='KO', share_price='60', shares_owned='1', distribution='0.51', term=str(term),
+                frequency='Monthly', contribution='100', volatility='0', purchase_mode='Fractional',
+                engine=engine, initial_capital='1000')
+    ttfbs, totals = [], []
+    for i in range(runs):
+        # Every run simulates, the first warms up and the last is traced
+        divcalc_data.result_cache.clear()
+        if i == runs - 1:
+            tracemalloc.start()
+        t = time.perf_counter()
+        response = client.post('/report', data=form, buffered=False)
+        chunks = iter(response.response)
+        first = next(chunks)
+        ttfb = time.perf_counter() - t
+        size = len(first) + sum(len(chunk) for chunk in chunks)
+        total = time.perf_counter() - t
+        response.close()
+        if i == runs - 1:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        elif i:
+            ttfbs.append(ttfb)
+            totals.append(total)
+    print(f'{engine} {term:3d}y monthly: min TTFB {min(ttfbs) * 1e3:6.1f} ms, min total {min(totals) * 1e3:6.1f} ms, '
+          f'peak {peak / 1024:7.0f} KiB, {size / 1024:.0f} KiB body')
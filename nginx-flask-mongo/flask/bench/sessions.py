@@ -0,0 +1,44 @@
+# Session load + save cost after a search, on the session interface directly.
+#   python bench/fake_alphavantage.py &
+#   DIVCALC_SESSION=filesystem|memory|mongo python bench/sessions.py [calls]
+# mongo needs a server at MONGO_URI
+import os
+import sys
+import time
+
+app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_dir)
+os.chdir(app_dir)
+os.environ.setdefault('ALPHAVANTAGE_URL', 'http://127.0.0.1:8765/query')
+
+calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+import divcalc_server
+from flask import request
+
+app = divcalc_server.app
+app.config['WTF_CSRF_ENABLED'] = False
+client = app.test_client()
+with client.session_transaction() as s:
+    s.update(username='bench', api_src='AlphaVantage', api_key='bench', initial_capital=None, shares_owned=None,
+             term=None, frequency=None, contribution=None, purchase_mode=None)
+response = client.post('/search', data={'stock_symbol': 'KO'})
+assert response.status_code == 200, response.status_code
+cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+
+interface = app.session_interface
+with app.test_request_context(headers={'Cookie': f'{cookie.key}={cookie.value}'}):
+    t = time.perf_counter()
+    for _ in range(calls):
+        session = interface.open_session(app, request)
+    load = (time.perf_counter() - t) / calls
+
+    session.modified = True
+    response = app.response_class()
+    t = time.perf_counter()
+    for _ in range(calls):
+        interface.save_session(app, session, response)
+    save = (time.perf_counter() - t) / calls
+
+print(f'{app.config["SESSION_TYPE"]}: load {load * 1e6:.0f} us, save {save * 1e6:.0f} us, '
+      f'keys {sorted(session.keys())}')
@@ -0,0 +1,141 @@
+import datetime
+
+###########################################################
+#
+# Per symbol dividend analytics, built once from the full
+# history and then only fed the payments newer than the
+# last one it has seen. Everything is JSON/BSON friendly
+# (ISO dates, string year keys) so the same dict goes in
+# the mongo store and the model cache.
+# The running state lives under 'state', the rest are the
+# derived fields pages read directly
+#
+###########################################################
+
+# A drop of more than this from the last two payments counts as a cut
+cut_tolerance = 0.01
+# A gap this many times the running mean interval counts as a suspension
+suspension_gap = 2.0
+cagr_years = (1, 5, 10)
+
+
+def emptyAnalytics():
+    return {
+        "frequency"         : None,
+        "payments"          : 0,
+        "first_payment"     : None,
+        "last_payment"      : None,
+        "last_amount"       : None,
+        "ttm_payout"        : 0.0,
+        "cagr_1y"           : None,
+        "cagr_5y"           : None,
+        "cagr_10y"          : None,
+        "cuts"              : [],
+        "suspensions"       : [],
+        "regularity"        : None,
+        "state"             : {
+            "year_counts"   : {},
+            "year_totals"   : {},
+            # (date, amount) paid in the 12 months up to the last payment, oldest first
+            "recent"        : [],
+            # Last two (date, amount), cuts compare against both so a special payout isn't a cut
+            "tail"          : [],
+            # Welford running mean/variance of the days between payments
+            "intervals"     : {"count": 0, "mean": 0.0, "m2": 0.0},
+        },
+    }
+
+
+def paymentRecords(records):
+    # AlphaVantage/store records -> (date, amount) oldest first, unusable rows and repeats dropped
+    payments = set()
+    for r in records:
+        try:
+            payments.add((datetime.date.fromisoformat(r['payment_date']), float(r['amount'])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return sorted(payments)
+
+
+def frequencyLabel(year_counts):
+    # Busiest calendar year, same thresholds the search always used
+    count = max(year_counts.values(), default=0)
+    if count >= 12:
+        return 'Monthly'
+    if count >= 4:
+        return 'Quarterly'
+    if count >= 2:
+        return 'Semiannual'
+    if count >= 1:
+        return 'Annual'
+    return None
+
+
+def updateAnalytics(analytics, records):
+    # Fold in the records newer than the last payment seen, O(new records)
+    state = analytics['state']
+    last = analytics['last_payment']
+    payments = [p for p in paymentRecords(records) if last is None or p[0].isoformat() > last]
+    if not payments:
+        return analytics
+
+    intervals = state['intervals']
+    for day, amount in payments:
+        iso = day.isoformat()
+        year = str(day.year)
+        state['year_counts'][year] = state['year_counts'].get(year, 0) + 1
+        state['year_totals'][year] = state['year_totals'].get(year, 0.0) + amount
+
+        tail = state['tail']
+        if tail:
+            previous_day = datetime.date.fromisoformat(tail[-1][0])
+            days = (day - previous_day).days
+            # Gaps are judged against the rhythm so far, before this interval joins it
+            if intervals['count'] >= 3 and days > suspension_gap * intervals['mean']:
+                analytics['suspensions'].append({'from': tail[-1][0], 'to': iso, 'days': days})
+            intervals['count'] += 1
+            delta = days - intervals['mean']
+            intervals['mean'] += delta / intervals['count']
+            intervals['m2'] += delta * (days - intervals['mean'])
+
+            if all(amount < a * (1 - cut_tolerance) for _, a in tail):
+                analytics['cuts'].append({
+                    "payment_date"  : iso,
+                    "from"          : tail[-1][1],
+                    "to"            : amount,
+                    "change_pct"    : 100 * (amount / tail[-1][1] - 1),
+                })
+        state['tail'] = (tail + [[iso, amount]])[-2:]
+        state['recent'].append([iso, amount])
+
+    ###########################################################
+    # Derived fields
+    ###########################################################
+    last_day = payments[-1][0]
+    window = (last_day - datetime.timedelta(days=365)).isoformat()
+    state['recent'] = [r for r in state['recent'] if r[0] > window]
+
+    analytics['payments'] += len(payments)
+    analytics['first_payment'] = analytics['first_payment'] or payments[0][0].isoformat()
+    analytics['last_payment'] = last_day.isoformat()
+    analytics['last_amount'] = payments[-1][1]
+    analytics['ttm_payout'] = sum(a for _, a in state['recent'])
+    analytics['frequency'] = frequencyLabel(state['year_counts'])
+
+    # Calendar year totals, from the last complete year back
+    totals = state['year_totals']
+    base = totals.get(str(last_day.year - 1), 0.0)
+    for n in cagr_years:
+        past = totals.get(str(last_day.year - 1 - n), 0.0)
+        analytics[f'cagr_{n}y'] = 100 * ((base / past) ** (1 / n) - 1) if base > 0 and past > 0 else None
+
+    if intervals['count'] >= 2 and intervals['mean'] > 0:
+        # 1 is clockwork, 0 is a spread as wide as the interval itself
+        deviation = (intervals['m2'] / (intervals['count'] - 1)) ** 0.5
+        analytics['regularity'] = max(0.0, 1 - deviation / intervals['mean'])
+    return analytics
+
+
+def analyzeHistory(records):
+    # Full build, the same fold over every record
+    return updateAnalytics(emptyAnalytics(), records)
@@ -1,4 +1,117 @@
-import json, requests, statistics
+import os, json, time, asyncio, threading, requests, statistics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import divcalc_cache
+import divcalc_metrics
+
+# Point at a local stub for testing/load tests
+base_url = os.environ.get('ALPHAVANTAGE_URL', 'https://www.alphavantage.co/query')
+
+# Per call (connect, read) timeout in seconds
+timeout = (float(os.environ.get('ALPHAVANTAGE_CONNECT_TIMEOUT', 3.05)),
+           float(os.environ.get('ALPHAVANTAGE_READ_TIMEOUT', 10)))
+
+# Rate limit "Note" responses are retried after backoff * 2^attempt seconds
+rate_limit_retries = int(os.environ.get('ALPHAVANTAGE_RATE_LIMIT_RETRIES', 2))
+rate_limit_backoff = float(os.environ.get('ALPHAVANTAGE_RATE_LIMIT_BACKOFF', 1.0))
+
+
+def createSession():
+    # Keep-alive pool shared by every AlphaVantage instance in the process.
+    # 5xx/429 responses and dropped connections are retried by urllib3 with backoff
+    retry = Retry(total=3,
+                  backoff_factor=0.5,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=4,
+                          pool_maxsize=int(os.environ.get('ALPHAVANTAGE_POOL_SIZE', 32)),
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+http_session = createSession()
+
+# Client side counters, connection reuse comes from the urllib3 pools themselves
+pool_counters = {
+    "requests"          : 0,
+    "retries"           : 0,
+    "rate_limited"      : 0,
+}
+pool_lock = threading.Lock()
+
+
+def countPool(name, n=1):
+    with pool_lock:
+        pool_counters[name] += n
+
+
+def poolStats():
+    connections = 0
+    pool_requests = 0
+    for adapter in set(http_session.adapters.values()):
+        for key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools[key]
+            connections += pool.num_connections
+            pool_requests += pool.num_requests
+    return {
+        **pool_counters,
+        "connections_opened": connections,
+        "connections_reused": max(0, pool_requests - connections),
+    }
+
+# Async client for the ASGI server (divcalc_asgi), made on first use inside the worker's
+# event loop. Calls past the pool size wait on a semaphore rather than in httpx's own
+# queue, which rescans every connection per waiting request and gets quadratic under load
+async_client = None
+async_slots = None
+async_pool_size = int(os.environ.get('ALPHAVANTAGE_ASYNC_POOL_SIZE', 32))
+
+
+def asyncClient():
+    global async_client, async_slots
+    if async_client is None:
+        import httpx
+        # The limits belong on the transport, the client ignores them when given one
+        limits = httpx.Limits(max_connections=async_pool_size, max_keepalive_connections=async_pool_size)
+        async_client = httpx.AsyncClient(timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+                                         transport=httpx.AsyncHTTPTransport(limits=limits, retries=1),
+                                         headers={'Accept-Encoding': 'gzip, deflate'})
+        async_slots = asyncio.Semaphore(async_pool_size)
+    return async_client
+
+
+async def closeAsyncClient():
+    global async_client, async_slots
+    if async_client is not None:
+        await async_client.aclose()
+        async_client = None
+        async_slots = None
+
+# Shared AlphaVantage response cache, keyed on (function, symbol)
+response_cache = divcalc_cache.createCache('responses', maxsize=int(os.environ.get('DIVCALC_CACHE_SIZE', 1024)))
+
+# Seconds each endpoint's response stays fresh. Functions not listed are never cached
+cache_ttl = {
+    'GLOBAL_QUOTE'      : 60,
+    'NEWS_SENTIMENT'    : 15 * 60,
+    'OVERVIEW'          : 24 * 60 * 60,
+    'DIVIDENDS'         : 24 * 60 * 60,
+}
+
+def cacheable(d):
+    # Never cache errors, empty results or rate limit notices
+    return bool(d) and not ('Error Message' in d or 'Note' in d or 'Information' in d)
+
+
+def rateLimited(d):
+    # Rate limits come back as a 200 with a "Note" or, from newer keys, an "Information"
+    # notice. Other "Information" texts (premium endpoints, bad keys) fail the same on a retry
+    return 'Note' in d or 'rate limit' in str(d.get('Information', '')).lower()
+
 
 class ManualStock:
     def __init__(self):
@@ -41,62 +154,172 @@ class ManualStock:
 
 
 class AlphaVantage:
+    # One instance per DataModel.getData call, so the memo below is request scoped
     def __init__(self, key):
         self.key = key
+        self.memo = {}
         if key == None:
             return {}
         
+    def query(self, function, symbol=None, symbol_field='symbol', **options):
+        # Request memo first: no endpoint is fetched twice for the same search
+        key = (function, symbol) + tuple(sorted(options.items()))
+        if key in self.memo:
+            return self.memo[key]
+
+        # Cached responses are shared, callers must not modify them
+        ttl = cache_ttl.get(function)
+        d = response_cache.get(key) if ttl is not None else None
+
+        if d is None:
+            params = dict(options, function=function, apikey=self.key)
+            if symbol is not None:
+                params[symbol_field] = symbol
+            with divcalc_metrics.timed(f'upstream_{function.lower()}'):
+                d = self.fetch(params)
+
+            if ttl is not None and cacheable(d):
+                response_cache.set(key, d, ttl)
+
+        self.memo[key] = d
+        return d
+
+    def refresh(self, function, symbol, ttl, symbol_field='symbol'):
+        # Watchlist scheduler: always upstream, cached for its own ttl so searches
+        # keep hitting the cache between refreshes. Memoized like query for follow-up calls
+        key = (function, symbol)
+        params = {'function': function, 'apikey': self.key, symbol_field: symbol}
+        with divcalc_metrics.timed(f'upstream_{function.lower()}'):
+            # No rate limit retries, the scheduler's token bucket does the pacing
+            d = self.fetch(params, retries=0)
+        if cacheable(d):
+            response_cache.set(key, d, ttl)
+        self.memo[key] = d
+        return d
+
+    def fetch(self, params, retries=rate_limit_retries):
+        for attempt in range(retries + 1):
+            r = http_session.get(base_url, params=params, timeout=timeout)
+            countPool('requests')
+            if r.raw is not None and r.raw.retries is not None:
+                countPool('retries', len(r.raw.retries.history))
+            # AlphaVantage errors come back as 200s, anything else is a failed call
+            r.raise_for_status()
+            d = r.json()
+
+            if not rateLimited(d) or attempt == retries:
+                return d
+            countPool('rate_limited')
+            time.sleep(rate_limit_backoff * 2 ** attempt)
+        return d
+
     def test(self):
-        url = f'https://www.alphavantage.co/query?function=MARKET_STATUS&apikey={self.key}'
-        r = requests.get(url)
-        return r.json()
+        return self.query('MARKET_STATUS')
         
 
     def getOverview(self, symbol):
-        url = f'https://www.alphavantage.co/query?function=OVERVIEW&symbol={symbol}&apikey={self.key}'
-        r = requests.get(url)
-        return r.json()
+        return self.query('OVERVIEW', symbol)
 
     def getQuote(self, symbol):
-        url = f'https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={self.key}'
-        r = requests.get(url)
-        d = r.json()
+        d = self.query('GLOBAL_QUOTE', symbol)
         return d['Global Quote']
 
     def getDividendHistory(self, symbol):
-        url = f'https://www.alphavantage.co/query?function=DIVIDENDS&symbol={symbol}&apikey={self.key}'
-        r = requests.get(url)
-        d = r.json()
+        d = self.query('DIVIDENDS', symbol)
         return d['data']
 
+    def getDailyPrices(self, symbol, full=True):
+        # Full history for a first load, the last 100 trading days for a refresh.
+        # Never in the response cache, divcalc_prices keeps these as arrays
+        return self.query('TIME_SERIES_DAILY', symbol, outputsize='full' if full else 'compact')
+
     def getNewsSentiment(self, symbol):
-        url = f'https://www.alphavantage.co/query?function=NEWS_SENTIMENT&tickers={symbol}&apikey={self.key}'
-        r = requests.get(url)
-        return r.json()
+        return self.query('NEWS_SENTIMENT', symbol, symbol_field='tickers')
 
     def getSentimentScore(self, symbol):
-        #Needsfeed sentiment
-        news = self.getNewsSentiment(symbol)
-                            
-        sentiment_scores = []
-        for article in news['feed']:
-            for sentiment in article.get('ticker_sentiment'):
-                if sentiment['ticker'] == symbol:
-                            sentiment_scores.append(float(sentiment['ticker_sentiment_score']))
-
-        if sentiment_scores:
-            sentiment_avg = statistics.mean(sentiment_scores)
-            if sentiment_avg >= 0.35:
-                sentiment_desc = 'Bullish'
-            elif sentiment_avg > 0.15:
-                sentiment_desc = 'Somewhat Bullish'
-            elif sentiment_avg <= -0.35:
-                sentiment_desc = 'Bearish'
-            elif sentiment_avg <= -0.15:
-                sentiment_desc = 'Somewhat-Bearish'
-            else:
-                sentiment_desc = 'Neutral'
+        # Reuses the memoized NEWS_SENTIMENT payload
+        return sentimentScore(self.getNewsSentiment(symbol), symbol)
+
+
+class AsyncAlphaVantage(AlphaVantage):
+    # Same calls, awaitable. getOverview, getNewsSentiment and getDailyPrices
+    # hand back query's coroutine unchanged, the rest are overridden below
+    async def query(self, function, symbol=None, symbol_field='symbol', **options):
+        key = (function, symbol) + tuple(sorted(options.items()))
+        if key in self.memo:
+            return self.memo[key]
+
+        ttl = cache_ttl.get(function)
+        d = await cacheCall(response_cache.get, key) if ttl is not None else None
+
+        if d is None:
+            params = dict(options, function=function, apikey=self.key)
+            if symbol is not None:
+                params[symbol_field] = symbol
+            with divcalc_metrics.timed(f'upstream_{function.lower()}'):
+                d = await self.fetch(params)
+
+            if ttl is not None and cacheable(d):
+                await cacheCall(response_cache.set, key, d, ttl)
+
+        self.memo[key] = d
+        return d
+
+    async def fetch(self, params, retries=rate_limit_retries):
+        for attempt in range(retries + 1):
+            client = asyncClient()
+            async with async_slots:
+                r = await client.get(base_url, params=params)
+            countPool('requests')
+            r.raise_for_status()
+            d = r.json()
+
+            if not rateLimited(d) or attempt == retries:
+                return d
+            countPool('rate_limited')
+            await asyncio.sleep(rate_limit_backoff * 2 ** attempt)
+        return d
+
+    async def getQuote(self, symbol):
+        d = await self.query('GLOBAL_QUOTE', symbol)
+        return d['Global Quote']
+
+    async def getDividendHistory(self, symbol):
+        d = await self.query('DIVIDENDS', symbol)
+        return d['data']
+
+    async def getSentimentScore(self, symbol):
+        return sentimentScore(await self.getNewsSentiment(symbol), symbol)
+
+
+async def cacheCall(method, *args):
+    # cacheCall(cache.get, key). Mongo backed caches block, keep them off the event loop
+    if isinstance(getattr(method, '__self__', None), divcalc_cache.MongoCache):
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+def sentimentScore(news, symbol):
+    # Score an already fetched NEWS_SENTIMENT payload for one ticker
+    sentiment_scores = []
+    for article in news.get('feed', []):
+        for sentiment in article.get('ticker_sentiment', []):
+            if sentiment['ticker'] == symbol:
+                sentiment_scores.append(float(sentiment['ticker_sentiment_score']))
+
+    if sentiment_scores:
+        sentiment_avg = statistics.mean(sentiment_scores)
+        if sentiment_avg >= 0.35:
+            sentiment_desc = 'Bullish'
+        elif sentiment_avg > 0.15:
+            sentiment_desc = 'Somewhat Bullish'
+        elif sentiment_avg <= -0.35:
+            sentiment_desc = 'Bearish'
+        elif sentiment_avg <= -0.15:
+            sentiment_desc = 'Somewhat-Bearish'
         else:
-            sentiment_desc = [float(sentiment['ticker_sentiment_score']) for sentiment in article.get('ticker_sentiment') ]
-            sentiment_avg = None
-        return f'{sentiment_desc} - Mean:{sentiment_avg}'
+            sentiment_desc = 'Neutral'
+    else:
+        sentiment_desc = 'Neutral'
+        sentiment_avg = None
+    return f'{sentiment_desc} - Mean:{sentiment_avg}'
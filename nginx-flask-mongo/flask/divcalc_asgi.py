@@ -0,0 +1,190 @@
+import io
+import os
+import json
+import asyncio
+import logging
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+from flask_wtf.csrf import validate_csrf
+from wtforms import ValidationError
+
+import divcalc_api
+import divcalc_prices
+import divcalc_server
+from divcalc_data import DataModel, NoDividendsError
+
+###########################################################
+#
+# Async serving: uvicorn divcalc_asgi:app, or in compose
+# GUNICORN_APP=divcalc_asgi:app with
+# GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker
+# A search's AlphaVantage round trips are awaited on the
+# event loop, so one worker holds hundreds of them in
+# flight instead of one per thread.
+# /api/search     - served here, Flask never sees it
+# POST /search    - upstream fetched here, then the Flask
+#                   view renders from the warm cache
+# everything else - Flask on a small thread pool
+#
+###########################################################
+
+flask_app = WSGIMiddleware(divcalc_server.app, workers=int(os.environ.get('DIVCALC_ASGI_THREADS', 16)))
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['method'] == 'POST':
+        if scope['path'] == '/api/search':
+            return await apiSearch(scope, receive, send)
+        if scope['path'] == '/search':
+            return await search(scope, receive, send)
+    await flask_app(scope, receive, send)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await divcalc_api.closeAsyncClient()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+###########################################################
+# Plumbing
+###########################################################
+
+async def readBody(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def replay(body, receive):
+    # The body was read here already, hand it to Flask again
+    sent = False
+
+    async def replayed():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+    return replayed
+
+
+async def sendJson(send, data, status=200):
+    body = json.dumps(data).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def wsgiEnviron(scope, body):
+    # Just enough of a WSGI environ for Flask to open the session and read the form
+    environ = {
+        'REQUEST_METHOD'    : scope['method'],
+        'SCRIPT_NAME'       : scope.get('root_path', ''),
+        'PATH_INFO'         : scope['path'],
+        'QUERY_STRING'      : scope['query_string'].decode('latin-1'),
+        'SERVER_NAME'       : (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT'       : str((scope.get('server') or ('localhost', 80))[1]),
+        'SERVER_PROTOCOL'   : f"HTTP/{scope['http_version']}",
+        'wsgi.url_scheme'   : scope.get('scheme', 'http'),
+        'wsgi.input'        : io.BytesIO(body),
+        'wsgi.errors'       : io.StringIO(),
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = value.decode('latin-1')
+    return environ
+
+
+def searchConfig(scope, body):
+    # The session's API source, if this is a genuine form post (same CSRF check the view makes)
+    flask = divcalc_server.app
+    with flask.request_context(wsgiEnviron(scope, body)) as context:
+        if flask.config.get('WTF_CSRF_ENABLED', True):
+            try:
+                validate_csrf(context.request.form.get('csrf_token'))
+            except ValidationError:
+                return None
+        return {'api_src': context.session.get('api_src'), 'api_key': context.session.get('api_key')}
+
+
+async def cachedModel(symbol):
+    return await divcalc_api.cacheCall(divcalc_server.model_cache.get, ('AlphaVantage', symbol))
+
+
+###########################################################
+# Routes
+###########################################################
+
+async def apiSearch(scope, receive, send):
+
+    ###########################################################
+    # Headless search, same result as the Flask /api/search:
+    #   {"symbol": "KO", "api_key": "..."}
+    ###########################################################
+    body = await readBody(receive)
+    if body is None:
+        return
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return await sendJson(send, {'error': 'Expected {"symbol": ..., "api_key": ...}'}, 400)
+    symbol = str(payload.get('symbol') or '').upper()
+    if not divcalc_prices.validSymbol(symbol):
+        return await sendJson(send, {'error': 'Invalid symbol'}, 400)
+
+    data = await cachedModel(symbol)
+    if data is None:
+        api_key = payload.get('api_key')
+        if api_key is None:
+            return await sendJson(send, {'error': f'No data for {symbol}, not cached and no api_key given'}, 400)
+        data_model = DataModel()
+        try:
+            await data_model.getDataAsync({'api_src': 'AlphaVantage', 'api_key': api_key}, symbol)
+        except NoDividendsError as e:
+            return await sendJson(send, {'error': str(e)}, 404)
+        except Exception:
+            logging.exception('Search upstream failed')
+            return await sendJson(send, {'error': 'Upstream request failed'}, 502)
+        if data_model.profile.get('stock_symbol') is None:
+            return await sendJson(send, {'error': f'No data for {symbol}'}, 404)
+        data = data_model.toDict()
+        await divcalc_api.cacheCall(divcalc_server.model_cache.set, ('AlphaVantage', symbol), data, divcalc_server.model_ttl)
+    await sendJson(send, data)
+
+
+async def search(scope, receive, send):
+    # Await the upstream calls here, the view's getData then hits the response cache for
+    # all of them and only holds a thread to parse and render. Anything that goes wrong
+    # is left for the view to report
+    body = await readBody(receive)
+    if body is None:
+        return
+    symbol = (parse_qs(body.decode('latin-1')).get('stock_symbol') or [''])[0].upper()
+    if divcalc_prices.validSymbol(symbol):
+        try:
+            config = await asyncio.to_thread(searchConfig, scope, body)
+            if config and config['api_src'] == 'AlphaVantage' and config['api_key']:
+                await DataModel().getDataAsync(config, symbol)
+        except NoDividendsError:
+            pass
+        except Exception:
+            logging.exception('Search prefetch failed')
+    await flask_app(scope, replay(body, receive), send)
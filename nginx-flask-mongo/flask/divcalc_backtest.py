@@ -0,0 +1,165 @@
+import math
+import datetime
+
+import numpy as np
+
+import divcalc_engine
+
+###########################################################
+#
+# Backtest: replay the real dividend record against daily
+# closes. The opening position is bought at the first close
+# on/after start, every payment_date after it pays
+# shares * amount and buys at that day's close (the last
+# close before it when markets were shut)
+#
+###########################################################
+
+# Years a term may reach back from the last close
+max_term = 100
+
+
+class BacktestError(Exception):
+    pass
+
+
+def isoDate(name, value):
+    # None, a date, or a YYYY-MM-DD string as a date
+    if value is None or isinstance(value, datetime.date):
+        return value
+    try:
+        if isinstance(value, str):
+            return datetime.date.fromisoformat(value)
+    except ValueError:
+        pass
+    raise BacktestError(f'{name} must be a YYYY-MM-DD date')
+
+
+def backtest(dividends, prices, start=None, end=None, initial_capital=0.0, shares_owned=0.0,
+             contribution=0.0, purchase_mode='Fractional', series=False):
+    # dividends: Dividend objects in any order. prices: price rows from divcalc_prices, oldest first
+    if purchase_mode not in ('Fractional', 'Modulus'):
+        raise BacktestError('purchase_mode must be Fractional or Modulus')
+    for name, value in (('initial_capital', initial_capital), ('shares_owned', shares_owned), ('contribution', contribution)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+            raise BacktestError(f'{name} must be a non-negative number')
+    start = isoDate('start', start)
+    end = isoDate('end', end)
+    if prices is None or len(prices) == 0:
+        raise BacktestError('No price history')
+    dates = prices['date']
+    closes = prices['close']
+
+    first = 0 if start is None else int(np.searchsorted(dates, np.datetime64(start, 'D'), side='left'))
+    last = len(dates) - 1 if end is None else int(np.searchsorted(dates, np.datetime64(end, 'D'), side='right')) - 1
+    if first >= len(dates) or last <= first:
+        raise BacktestError('No trading days in the requested range')
+    start_day, end_day = dates[first], dates[last]
+    start_price, end_price = float(closes[first]), float(closes[last])
+
+    # Payments strictly after the opening purchase, up to the last day
+    paid = sorted((d.payment_date, float(d.amount)) for d in dividends
+                  if d.payment_date is not None and start_day < np.datetime64(d.payment_date, 'D') <= end_day)
+    pay_dates = np.array([p[0] for p in paid], dtype='datetime64[D]')
+    amounts = np.array([p[1] for p in paid], dtype=float)
+    pay_prices = np.asarray(closes[np.searchsorted(dates, pay_dates, side='right') - 1], dtype=float)
+
+    # Opening position, same as Calculator.run
+    balance = 0.0
+    if purchase_mode == 'Fractional':
+        shares_owned += initial_capital / start_price
+    else:
+        bought = initial_capital // start_price
+        shares_owned += bought
+        balance = initial_capital - bought * start_price
+    initial_shares = shares_owned
+
+    ###########################################################
+    # Replay payments
+    ###########################################################
+    n = len(paid)
+    if purchase_mode == 'Fractional':
+        # Whole balance spent every payment: the same recurrence as a vectorized run,
+        # with each payment's own amount and price
+        owned = divcalc_engine.fractionalPath(shares_owned, pay_prices, amounts, contribution) if n else np.empty(0)
+        held = np.concatenate(([shares_owned], owned[:-1]))
+        balances = np.zeros(n)
+        shares_owned = float(owned[-1]) if n else shares_owned
+    else:
+        # Whole shares only, a few hundred payments at most
+        owned = np.empty(n)
+        held = np.empty(n)
+        balances = np.empty(n)
+        for i, (amount, price) in enumerate(zip(amounts.tolist(), pay_prices.tolist())):
+            held[i] = shares_owned
+            balance += shares_owned * amount + contribution
+            bought = balance // price
+            shares_owned += bought
+            balance -= bought * price
+            owned[i] = shares_owned
+            balances[i] = balance
+
+    dividend_cash = held * amounts
+    total = {
+        "start_date"            : str(start_day),
+        "end_date"              : str(end_day),
+        "years"                 : float((end_day - start_day).astype(int)) / 365.25,
+        "payments"              : n,
+        "start_price"           : start_price,
+        "end_price"             : end_price,
+        "initial_capital"       : initial_capital,
+        "initial_shares"        : initial_shares,
+        "contributions"         : contribution * n,
+        "investment_tot"        : initial_capital + contribution * n,
+        "total_reinvested"      : float(dividend_cash.sum()),
+        "shares_owned"          : shares_owned,
+        "cash"                  : balance,
+        "ending_assets"         : shares_owned * end_price,
+    }
+    # Trailing twelve months of payouts per share, on the shares held at the end
+    ttm = amounts[pay_dates > end_day - np.timedelta64(365, 'D')].sum()
+    total['income_annual'] = float(ttm) * shares_owned
+    invested = total['investment_tot'] + initial_shares * start_price - initial_capital
+    total['total_return_pct'] = 100 * ((total['ending_assets'] + balance) / invested - 1) if invested > 0 else 0.0
+    total['price_return_pct'] = 100 * (end_price / start_price - 1)
+
+    result = {
+        'totals': total,
+        'rows': {
+            "payment_date"      : pay_dates.astype(str).tolist(),
+            "amount"            : amounts.tolist(),
+            "price"             : pay_prices.tolist(),
+            "dividend"          : dividend_cash.tolist(),
+            "contribution"      : [contribution] * n,
+            "shares_purchased"  : (owned - held).tolist(),
+            "shares_owned"      : owned.tolist(),
+            "balance"           : balances.tolist(),
+            "asset_value"       : (owned * pay_prices).tolist(),
+        },
+    }
+
+    if series:
+        # Daily value: shares held after the latest payment on or before each day, at that day's close
+        days = dates[first:last + 1]
+        step = np.searchsorted(pay_dates, days, side='right')
+        shares_daily = np.concatenate(([initial_shares], owned))[step]
+        result['series'] = {
+            "date"          : days.astype(str).tolist(),
+            "close"         : np.asarray(closes[first:last + 1]).tolist(),
+            "asset_value"   : (shares_daily * closes[first:last + 1]).tolist(),
+        }
+    return result
+
+
+def startDate(prices, term):
+    # term years back from the last close
+    if isinstance(term, bool) or not isinstance(term, int) or not 1 <= term <= max_term:
+        raise BacktestError(f'term must be a whole number of years, 1-{max_term}')
+    if prices is None or len(prices) == 0:
+        return None
+    end = prices['date'][-1].astype(datetime.date)
+    try:
+        return end.replace(year=end.year - term)
+    except ValueError:
+        # Feb 29th
+        return end.replace(year=end.year - term, day=28)
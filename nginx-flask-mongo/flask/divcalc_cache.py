@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+###########################################################
+#
+# Shared caches
+# TTLCache   - in process memory (default)
+# MongoCache - same interface on the compose Mongo service
+# SizedCache - in process LRU bounded by bytes, for results
+#
+###########################################################
+
+class TTLCache:
+    # LRU with a per-entry expiry, safe to share between request threads
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend"   : 'memory',
+            "size"      : len(self.entries),
+            "maxsize"   : self.maxsize,
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "evictions" : self.evictions,
+            "hit_rate"  : self.hits / lookups if lookups else 0.0,
+        }
+
+
+class MongoCache:
+    # Shared between workers/containers. Mongo's TTL monitor only sweeps
+    # once a minute, so expiry is also checked on read
+    def __init__(self, name, maxsize=5000):
+        self.name = name
+        self.maxsize = maxsize
+        self._collection = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def collection(self):
+        # Connect on first use, never at import (gunicorn forks after importing the app)
+        if self._collection is None:
+            collection = mongoDatabase()[self.name]
+            collection.create_index('expires_at', expireAfterSeconds=0)
+            collection.create_index('used_at')
+            self._collection = collection
+        return self._collection
+
+    def get(self, key):
+        now = time.time()
+        doc = self.collection.find_one_and_update(
+            {'_id': self.docId(key), 'expires_at': {'$gt': now}},
+            {'$set': {'used_at': now}},
+            projection={'value': True})
+        if doc is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(doc['value'])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        # Payload keys like '05. price' aren't friendly Mongo field names, store it as JSON text
+        self.collection.replace_one(
+            {'_id': self.docId(key)},
+            {'value': json.dumps(value), 'expires_at': now + ttl, 'used_at': now},
+            upsert=True)
+
+        # Trim least recently used entries past the size limit
+        excess = self.collection.estimated_document_count() - self.maxsize
+        if excess > 0:
+            stale = [d['_id'] for d in self.collection.find({}, {'_id': True}).sort('used_at', 1).limit(excess)]
+            self.evictions += self.collection.delete_many({'_id': {'$in': stale}}).deleted_count
+
+    def clear(self):
+        self.collection.delete_many({})
+
+    def reset(self):
+        # Forget the collection (and its client), reconnects on next use
+        self._collection = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend"   : 'mongo',
+            "size"      : self.collection.estimated_document_count(),
+            "maxsize"   : self.maxsize,
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "evictions" : self.evictions,
+            "hit_rate"  : self.hits / lookups if lookups else 0.0,
+        }
+
+    def docId(self, key):
+        return ':'.join(str(k) for k in key)
+
+
+class SizedCache:
+    # LRU without expiry, bounded by the caller reported size of each value.
+    # For deterministic results that stay valid for the life of the process
+    def __init__(self, maxbytes=64 * 2**20):
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, size):
+        # Anything bigger than the whole budget isn't worth flushing the cache for
+        if size > self.maxbytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[0]
+            self.entries[key] = (size, value)
+            self.nbytes += size
+            while self.nbytes > self.maxbytes:
+                evicted = self.entries.popitem(last=False)[1]
+                self.nbytes -= evicted[0]
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend"   : 'memory',
+            "size"      : len(self.entries),
+            "bytes"     : self.nbytes,
+            "maxbytes"  : self.maxbytes,
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "evictions" : self.evictions,
+            "hit_rate"  : self.hits / lookups if lookups else 0.0,
+        }
+
+
+mongo_client = None
+
+
+def resetClient():
+    # Forked workers must not reuse the parent's client, drop it without closing
+    # (closing would also tear down the parent's sockets and monitor threads)
+    global mongo_client
+    mongo_client = None
+
+
+def mongoDatabase():
+    # One client (and connection pool) per process
+    global mongo_client
+    if mongo_client is None:
+        from pymongo import MongoClient
+        mongo_client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://mongo:27017'))
+    return mongo_client[os.environ.get('MONGO_DB', 'divcalc')]
+
+
+def createCache(name, maxsize):
+    # DIVCALC_CACHE=mongo moves the cache into the compose Mongo service
+    if os.environ.get('DIVCALC_CACHE', 'memory') == 'mongo':
+        return MongoCache(f'cache_{name}', maxsize=maxsize)
+    return TTLCache(maxsize=maxsize)
@@ -1,18 +1,294 @@
+import os
+import json
+import asyncio
+import hashlib
 import datetime
 import random
+from decimal import Decimal
 from dateutil import parser
-from collections import Counter
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import divcalc_api
+import divcalc_cache
+import divcalc_engine
+import divcalc_metrics
+import divcalc_store
+
+
+frequency_map = {
+    'Monthly'   : 12,
+    'Quarterly' : 4,
+    'Semiannual': 2,
+    'Annual'    : 1
+}
+
+months_map = {
+    1   : ['December'],
+    2   : ['June', 'December'],
+    4   : ['March', 'June', 'September', 'December'],
+    12  : ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+}
+
+quarters_map = {
+    1   : ['Q4'],
+    2   : ['Q2', 'Q4'],
+    4   : ['Q1', 'Q2', 'Q3', 'Q4'],
+    12  : ['Q1', 'Q1', 'Q1', 'Q2', 'Q2', 'Q2', 'Q3', 'Q3', 'Q3', 'Q4', 'Q4', 'Q4']
+}
+
+
+# Upstream calls for a search run side by side, shared by all requests in the process
+fetch_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='divcalc-fetch')
+
+# Deterministic simulation results (no volatility, or a fixed seed), bounded by memory
+result_cache = divcalc_cache.SizedCache(maxbytes=int(os.environ.get('DIVCALC_RESULT_CACHE_MB', 64)) * 2**20)
+
+# Config keys that change a simulation's result
+result_keys = ('term', 'initial_capital', 'shares_owned', 'contribution', 'share_price',
+               'volatility', 'distribution', 'purchase_mode', 'frequency', 'engine', 'seed')
+
+class NoDividendsError(Exception):
+    # Symbol found upstream, but it has never paid a dividend
+    pass
+
+
+# One report row as handed to templates, all values raw (formatting lives in the templates)
+ReportRow = namedtuple('ReportRow', [
+    'period', 'year', 'quarter', 'month',
+    'balance', 'shares_owned', 'share_price', 'asset_value',
+    'dividend', 'income', 'contribution', 'shares_purchased',
+])
+
+
+class Report:
+    # Columnar simulation report, one float64 array per numeric field.
+    # Period/year/quarter/month are derived from the period index on demand
+    columns = ('balance', 'shares_owned', 'share_price', 'asset_value',
+               'dividend', 'income', 'contribution', 'shares_purchased')
+
+    __slots__ = ('periods', 'income_sequence') + columns
+
+    def __init__(self, periods, income_sequence):
+        self.periods = periods
+        self.income_sequence = income_sequence
+        for c in self.columns:
+            setattr(self, c, np.zeros(periods))
+
+    def __len__(self):
+        return self.periods
+
+    def __iter__(self):
+        # Converted to Python floats a block at a time, streamed rendering stays flat in memory
+        months = months_map[self.income_sequence]
+        quarters = quarters_map[self.income_sequence]
+        for start in range(0, self.periods, 256):
+            values = zip(*(getattr(self, c)[start:start + 256].tolist() for c in self.columns))
+            for i, v in enumerate(values, start):
+                yield ReportRow(i + 1,
+                                i // self.income_sequence + 1,
+                                quarters[i % len(quarters)],
+                                months[i % len(months)],
+                                *v)
+
+    @property
+    def period(self):
+        return np.arange(1, self.periods + 1)
+
+    @property
+    def year(self):
+        return np.arange(self.periods) // self.income_sequence + 1
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, c).nbytes for c in self.columns)
+
+    def row(self, i):
+        # Single row by 0-based index, same shape as iteration
+        months = months_map[self.income_sequence]
+        quarters = quarters_map[self.income_sequence]
+        return ReportRow(i + 1,
+                         i // self.income_sequence + 1,
+                         quarters[i % len(quarters)],
+                         months[i % len(months)],
+                         *(getattr(self, c)[i].item() for c in self.columns))
+
+    def freeze(self):
+        # Cached reports are shared between requests, make accidental writes fail loudly
+        for c in self.columns:
+            getattr(self, c).flags.writeable = False
+        return self
 
 
 class Calculator:
     def __init__(self, data_model):
         self.data_model = data_model
         self.config = data_model.config
-        self.report = [] #data_model.report
+        self.report = None
         
         self.totals = {}
+        self.bands = None
         
-    def run(self):
+    def rows(self):
+        # Report rows as a generator, simulating first if nothing has run yet
+        if self.report is None:
+            self.run()
+        yield from self.report
+
+    def run(self, cache=True):
+
+        # Repeat of a deterministic config, reuse the totals and (read only) report
+        key = self.resultKey('run') if cache else None
+        if key is not None:
+            cached = result_cache.get(key)
+            if cached is not None:
+                self.totals = dict(cached[0])
+                self.report = cached[1]
+                return
+
+        # Array engine covers fractional purchases, the loop stays the reference
+        if self.config.get('engine') == 'Vectorized' and self.config['purchase_mode'] == 'Fractional':
+            self.runVectorized()
+        else:
+            self.runLoop()
+
+        if key is not None:
+            result_cache.set(key, (dict(self.totals), self.report.freeze()), self.report.nbytes)
+
+    def closedForm(self):
+        # Flat price fractional purchases have an exact O(1) solution
+        return self.config['volatility'] <= 0 and self.config['purchase_mode'] == 'Fractional'
+
+    def runTotals(self, cache=True):
+        # Summary totals only, no report. Closed form when possible, otherwise a full run
+        if not self.closedForm():
+            return self.run(cache=cache)
+
+        term = self.config['term']
+        initial_capital = self.config['initial_capital']
+        contribution = self.config['contribution']
+        share_price = self.config['share_price']
+        distribution = self.config['distribution']
+        shares_owned = self.config['shares_owned'] + initial_capital / share_price
+
+        self.totals = {
+            "initial_capital"       : initial_capital,
+            "contributions"         : 0.00,
+            "initial_shares"        : shares_owned,
+            "starting_assets"       : shares_owned * share_price,
+            "starting_distribution" : shares_owned * distribution,
+            "total_reinvested"      : 0.00,
+        }
+
+        income_sequence = frequency_map.get(self.config['frequency'], 1)
+        periods = term * income_sequence
+        solved = divcalc_engine.fractionalClosedForm(shares_owned, share_price, distribution, contribution, periods)
+
+        self.totals['contributions'] = contribution * periods
+        self.totals['total_reinvested'] = float(solved['total_reinvested'])
+
+        self.rollup(periods, term, 0.00, float(solved['shares_owned']), share_price, income_sequence)
+
+    def periodRow(self, p):
+        # Any single 1-based period on demand. Closed form needs no run at all
+        periods = self.config['term'] * frequency_map.get(self.config['frequency'], 1)
+        if not 1 <= p <= periods:
+            raise IndexError(f'Period {p} outside 1..{periods}')
+
+        if not self.closedForm():
+            if self.report is None:
+                self.run()
+            return self.report.row(p - 1)
+
+        share_price = self.config['share_price']
+        distribution = self.config['distribution']
+        contribution = self.config['contribution']
+        income_sequence = frequency_map.get(self.config['frequency'], 1)
+        shares_owned = self.config['shares_owned'] + self.config['initial_capital'] / share_price
+
+        held, owned = divcalc_engine.fractionalClosedForm(shares_owned, share_price, distribution, contribution,
+                                                          [p - 1, p])['shares_owned'].tolist()
+        months = months_map[income_sequence]
+        quarters = quarters_map[income_sequence]
+        return ReportRow(p,
+                         (p - 1) // income_sequence + 1,
+                         quarters[(p - 1) % len(quarters)],
+                         months[(p - 1) % len(months)],
+                         0.00,
+                         owned,
+                         share_price,
+                         owned * share_price,
+                         distribution,
+                         owned * distribution,
+                         contribution,
+                         owned - held)
+
+    def blocks(self, size=4096):
+        # Report columns a block of periods at a time, as (start, {column: array}).
+        # Closed form solves each block on its own, so memory stays flat however long
+        # the term; other configs run once and slice the report
+        if not self.closedForm():
+            if self.report is None:
+                self.run()
+            for start in range(0, len(self.report), size):
+                yield start, {c: getattr(self.report, c)[start:start + size] for c in Report.columns}
+            return
+
+        share_price = self.config['share_price']
+        distribution = self.config['distribution']
+        contribution = self.config['contribution']
+        periods = self.config['term'] * frequency_map.get(self.config['frequency'], 1)
+        shares_owned = self.config['shares_owned'] + self.config['initial_capital'] / share_price
+
+        for start in range(0, periods, size):
+            stop = min(start + size, periods)
+            owned = divcalc_engine.fractionalClosedForm(shares_owned, share_price, distribution, contribution,
+                                                        np.arange(start, stop + 1))['shares_owned']
+            n = stop - start
+            yield start, {
+                "balance"           : np.zeros(n),
+                "shares_owned"      : owned[1:],
+                "share_price"       : np.full(n, float(share_price)),
+                "asset_value"       : owned[1:] * share_price,
+                "dividend"          : np.full(n, float(distribution)),
+                "income"            : owned[1:] * distribution,
+                "contribution"      : np.full(n, float(contribution)),
+                "shares_purchased"  : np.diff(owned),
+            }
+
+    def resultKey(self, kind, **extra):
+        # Canonical hash of the result driving config, None when the result is random
+        config = {k: self.config.get(k) for k in result_keys}
+        config.update(extra)
+        if kind == 'bands':
+            # Monte Carlo is always random, only a seed makes it repeatable
+            config['engine'] = None
+            config['paths'] = self.config.get('paths') or 1000
+            if config['seed'] is None:
+                return None
+        elif config['volatility'] > 0:
+            if config['seed'] is None:
+                return None
+        else:
+            # Flat price path, the seed changes nothing
+            config['seed'] = None
+
+        # Vectorized only applies to fractional purchases
+        if config['engine'] is not None and not (config['engine'] == 'Vectorized' and config['purchase_mode'] == 'Fractional'):
+            config['engine'] = 'Loop'
+
+        # 10, 10.0 and Decimal('10.00') are the same input
+        for k, v in config.items():
+            if isinstance(v, (float, Decimal)):
+                v = float(v)
+                config[k] = int(v) if v.is_integer() else v
+
+        canonical = json.dumps([kind, config], sort_keys=True)
+        return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+    def runLoop(self):
 
         term = self.config['term']
         initial_capital = self.config['initial_capital']
@@ -24,7 +300,8 @@ class Calculator:
         purchase_mode = self.config['purchase_mode']
         frequency = self.config['frequency']
 
-
+        # Seeded runs repeat the same price path
+        rng = random.Random(self.config.get('seed'))
 
 
         ###########################################################
@@ -65,40 +342,17 @@ class Calculator:
             case 'Annual':
                income_sequence = 1
         
-        frequency_map = {
-            'Monthly'   : 12,
-            'Quarterly' : 4,
-            'Semiannual': 2,
-            'Annual'    : 1
-        }
-        
-        months_map = {
-            1   : ['December'],
-            2   : ['June', 'December'],
-            4   : ['March', 'June', 'September', 'December'],
-            12  : ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
-        }
-        
-        quarters_map = {
-            1   : ['Q4'],
-            2   : ['Q2', 'Q4'],
-            4   : ['Q1', 'Q2', 'Q3', 'Q4'],
-            12  : ['Q1', 'Q1', 'Q1', 'Q2', 'Q2', 'Q2', 'Q3', 'Q3', 'Q3', 'Q4', 'Q4', 'Q4']
-        }
-        
         income_sequence = frequency_map.get(frequency, 1)
-        months = months_map[income_sequence]
-        quarters = quarters_map[income_sequence]
 
-        #report = []
+        report = Report(term * income_sequence, income_sequence)
+        report.dividend[:] = distribution
+        report.contribution[:] = contribution
         
         # Loop through term
         for p in range(1, 1 + (term * income_sequence)):
             
-            # Calculate period to year/quarter/month based on frequency
+            # Calculate period to year based on frequency
             year = (p - 1) // income_sequence + 1
-            month = months[(p - 1) % len(months)]
-            quarter = quarters[(p - 1) % len(quarters)]
                 
             # Calculate dividend
             dividend = shares_owned * distribution
@@ -110,7 +364,7 @@ class Calculator:
             if volatility > 0:
                 v1 = share_price + (share_price * (volatility -1)) / 100
                 v2 = share_price - (share_price * (volatility -1)) / 100
-                share_price = round(random.uniform(v1, v2),4)
+                share_price = round(rng.uniform(v1, v2),4)
 
             # Define allocation of shares to purchase
             if purchase_mode == 'Fractional':
@@ -124,29 +378,129 @@ class Calculator:
                 shares_owned += shares_purchased
                 balance = balance - (shares_purchased * share_price)
 
-            row_data = {
-                "period"            : p,
-                "year"              : year,
-                "quarter"           : quarter,
-                "month"             : month,
-                "balance"           : balance,
-                "shares_owned"      : shares_owned,
-                "share_price"       : share_price,
-                "asset_value"       : shares_owned * share_price,
-                "dividend"          : f'${distribution:,.2f}',
-                "income"            : f'${(distribution * shares_owned):,.2f}',
-                "contribution"      : f'${contribution:,.2f}',
-                "shares_purchased"  : shares_purchased,
-            }
+            i = p - 1
+            report.balance[i]           = balance
+            report.shares_owned[i]      = shares_owned
+            report.share_price[i]       = share_price
+            report.shares_purchased[i]  = shares_purchased
             self.totals['contributions'] += contribution
             self.totals['total_reinvested'] += dividend
-            
-            self.report.append(row_data)
        
-       ###########################################################
-       # Roll up totals
-       ###########################################################
-        self.totals['periods'] = p
+        # Derived columns in one pass
+        report.asset_value[:] = report.shares_owned * report.share_price
+        report.income[:] = report.shares_owned * distribution
+        self.report = report
+
+        self.rollup(p, year, balance, shares_owned, share_price, income_sequence)
+
+    def runVectorized(self):
+
+        term = self.config['term']
+        initial_capital = self.config['initial_capital']
+        shares_owned = self.config['shares_owned']
+        contribution = self.config['contribution']
+        share_price = self.config['share_price']
+        volatility = self.config['volatility']
+        distribution = self.config['distribution']
+        frequency = self.config['frequency']
+
+        ###########################################################
+        # Initialize assets and beginning balance
+        ###########################################################
+        shares_owned += initial_capital / share_price
+
+        self.totals = {
+            "initial_capital"       : initial_capital,
+            "contributions"         : 0.00,
+            "initial_shares"        : shares_owned,
+            "starting_assets"       : shares_owned * share_price,
+            "starting_distribution" : shares_owned * distribution,
+            "total_reinvested"      : 0.00,
+        }
+
+        ###########################################################
+        # Simulate all periods at once
+        ###########################################################
+        income_sequence = frequency_map.get(frequency, 1)
+        periods = term * income_sequence
+
+        rng    = np.random.default_rng(self.config.get('seed'))
+        prices = divcalc_engine.pricePath(share_price, volatility, periods, rng)
+        owned  = divcalc_engine.fractionalPath(shares_owned, prices, distribution, contribution)
+        # Dividends are paid on the shares held going into each period
+        held   = np.concatenate(([shares_owned], owned[:-1]))
+
+        report = Report(periods, income_sequence)
+        report.shares_owned[:]      = owned
+        report.share_price[:]       = prices
+        report.asset_value[:]       = owned * prices
+        report.dividend[:]          = distribution
+        report.income[:]            = owned * distribution
+        report.contribution[:]      = contribution
+        report.shares_purchased[:]  = owned - held
+        self.report = report
+
+        self.totals['contributions'] = contribution * periods
+        self.totals['total_reinvested'] = distribution * float(held.sum())
+
+        self.rollup(periods, term, 0.00, float(owned[-1]), float(prices[-1]), income_sequence)
+
+    def runMonteCarlo(self, percentiles=(5, 50, 95), final=False):
+
+        # Seeded bands repeat exactly, reuse them
+        key = self.resultKey('bands', percentiles=list(percentiles), final=final)
+        if key is not None:
+            cached = result_cache.get(key)
+            if cached is not None:
+                self.bands = cached
+                return self.bands
+
+        initial_capital = self.config['initial_capital']
+        shares_owned = self.config['shares_owned']
+        share_price = self.config['share_price']
+        purchase_mode = self.config['purchase_mode']
+        income_sequence = frequency_map.get(self.config['frequency'], 1)
+
+        # Opening position matches run()
+        balance = 0.00
+        if purchase_mode == 'Fractional':
+            shares_owned += initial_capital / share_price
+        else:
+            shares_purchased = initial_capital // share_price
+            shares_owned += shares_purchased
+            balance = initial_capital - (shares_purchased * share_price)
+
+        # Percentile bands across many price paths in one batch
+        self.bands = divcalc_engine.monteCarlo(
+            shares_owned    = shares_owned,
+            balance         = balance,
+            share_price     = share_price,
+            distribution    = self.config['distribution'],
+            contribution    = self.config['contribution'],
+            volatility      = self.config['volatility'],
+            periods         = self.config['term'] * income_sequence,
+            purchase_mode   = purchase_mode,
+            paths           = self.config.get('paths') or 1000,
+            seed            = self.config.get('seed'),
+            percentiles     = percentiles,
+            final           = final,
+        )
+        if key is not None:
+            self.bands["asset_value"].flags.writeable = False
+            self.bands["income"].flags.writeable = False
+            result_cache.set(key, self.bands, self.bands["asset_value"].nbytes + self.bands["income"].nbytes)
+        return self.bands
+
+    def rollup(self, periods, year, balance, shares_owned, share_price, income_sequence):
+
+        term = self.config['term']
+        initial_capital = self.config['initial_capital']
+        distribution = self.config['distribution']
+
+        ###########################################################
+        # Roll up totals
+        ###########################################################
+        self.totals['periods'] = periods
         self.totals['years_vested'] = year
        
         # Investment
@@ -162,7 +516,7 @@ class Calculator:
         self.totals['distribution_growth_tot'] = self.totals['ending_distribution'] - self.totals['starting_distribution']
         
         # If you zero out inputs, you have no growth!
-        if self.totals['distribution_growth_tot'] > 0:
+        if self.totals['distribution_growth_tot'] > 0 and self.totals['starting_distribution'] > 0:
             self.totals['distribution_growth_pct'] = 100 * (self.totals['distribution_growth_tot'] / self.totals['starting_distribution'])
         else:
             self.totals['distribution_growth_pct'] = 0
@@ -173,6 +527,21 @@ class Calculator:
 
 
 
+def parseDate(value):
+    # Upstream dates are ISO 'YYYY-MM-DD', fuzzy dateutil parsing only for odd input.
+    # Unparseable values (AlphaVantage sends the string 'None') become None
+    if value is None or isinstance(value, datetime.date):
+        return value.date() if isinstance(value, datetime.datetime) else value
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return parser.parse(value).date()
+    except (ValueError, OverflowError):
+        return None
+
+
 class Dividend:
     # Standard mapping for dividend data from variable API sources
     # Dividend History structure: [
@@ -180,17 +549,29 @@ class Dividend:
     #           amount, declaration_date, record_date, payment_date, open_price, close_price
     #         },...
     #     ]
+    # Dates are held as datetime.date, strings are parsed on the way in
     def __init__(self, amount, payment_date, declaration_date=None, record_date=None, open_price=None, close_price=None):
         # Required fields
         self.amount = amount
-        self.payment_date = payment_date
+        self.payment_date = parseDate(payment_date)
         # Optional fields
-        self.declaration_date = declaration_date
-        self.record_date = record_date
-        # FIXME Need to add open and close price for the dividend date
+        self.declaration_date = parseDate(declaration_date)
+        self.record_date = parseDate(record_date)
+        # Open and close of the payment day, divcalc_prices.attachPrices fills them from the price cache
         self.open_price = open_price
         self.close_price = close_price
 
+    def toDict(self):
+        # JSON friendly, dates as ISO strings
+        return {
+            "amount"            : self.amount,
+            "payment_date"      : self.payment_date.isoformat() if self.payment_date else None,
+            "declaration_date"  : self.declaration_date.isoformat() if self.declaration_date else None,
+            "record_date"       : self.record_date.isoformat() if self.record_date else None,
+            "open_price"        : self.open_price,
+            "close_price"       : self.close_price,
+        }
+
 
 class DataModel:
         def __init__(self):
@@ -207,6 +588,8 @@ class DataModel:
             
             #FIXME Emulate dividend history
             self.dividend_history = {}
+            self.dividend_analytics = None
+            self.dividend_frequency = None
             
             self.financials = {
                 "dividend"          : None,
@@ -235,6 +618,9 @@ class DataModel:
                 "purchase_mode"     : None,
                 "frequency"         : None,
                 "dividend"          : None,
+                "engine"            : None,
+                "paths"             : None,
+                "seed"              : None,
             }
             
         def getData(self, config, symbol=None):
@@ -252,117 +638,135 @@ class DataModel:
                 api_functions = ManualStock()
             
             if config['api_src'] == 'AlphaVantage':
-                from divcalc_api import AlphaVantage
-                api_functions = AlphaVantage(key=config['api_key'])
-            
-                overview = api_functions.getOverview(symbol)
-                
-                
+                api_functions = divcalc_api.AlphaVantage(key=config['api_key'])
+
+                # All four at once, latency is the slowest call rather than the sum.
+                # The overview still decides: an unknown symbol drops the others' results
+                overview_call  = fetch_pool.submit(divcalc_metrics.bind(api_functions.getOverview), symbol)
+                dividends_call = fetch_pool.submit(divcalc_metrics.bind(divcalc_store.dividendHistory), symbol, api_functions)
+                quote_call     = fetch_pool.submit(divcalc_metrics.bind(api_functions.getQuote), symbol)
+                news_call      = fetch_pool.submit(divcalc_metrics.bind(api_functions.getNewsSentiment), symbol)
+
+                overview = overview_call.result()
+
                 # If data not found, return None
                 if overview == {} or 'Error Message' in overview:
                     return None
 
+                dividends = dividends_call.result()
+                quote     = quote_call.result()
 
-                ########################################################
-                #
-                # Dividend History
-                #
-                ########################################################
-
-                # Historical is ordered newest -> oldest
-                dividends = api_functions.getDividendHistory(symbol)
-                # Convert date strings to datetime objects
-                for d in dividends:
-                    # Ensure all date strings are valid for each dividend
-                    if len(d['payment_date']) != 10 or len(d['declaration_date']) != 10 or len(d['record_date']) != 10:
-                        pass
-                    else:
-                        d['payment_date'] = parser.parse(d['payment_date']).strftime('%Y-%m-%d')
-                        d['declaration_date'] = parser.parse(d['declaration_date']).strftime('%Y-%m-%d')
-                        d['record_date'] = parser.parse(d['record_date']).strftime('%Y-%m-%d')
-                
-                # Create Dividend objects that contain additional fields and utilities 
-                self.dividend_history = []
-                
-                for d in dividends:
-                    if len(d['payment_date']) == 10:
-                        dividend = Dividend(
-                            amount=d['amount'], 
-                            payment_date=d['payment_date'], 
-                            declaration_date=d['declaration_date'], 
-                            record_date=d['record_date'])
-                        self.dividend_history.append(dividend)
-                # First is newest in AplhaVantage
-                dividend  = self.dividend_history[0]
+                # News is optional, a failed or timed out feed still leaves a usable model
+                try:
+                    news  = news_call.result()
+                except Exception:
+                    news  = {}
 
-                # Determine dividend frequency                
-                self.dividend_frequency = self.getDividedFrequency(dividends)     
-                
-                quote     = api_functions.getQuote(symbol)
-                news      = api_functions.getNewsSentiment(symbol)
-
-                self.profile = {
-                    "stock_symbol"      : symbol,
-                    "company_name"      : overview['Name'],
-                    "company_desc"      : overview['Description'],
-                    "company_website"   : overview['OfficialSite'],
-                    "stock_sector"      : overview['Sector'],
-                    "stock_industry"    : overview['Industry'],
-                    "exchange"          : overview['Exchange'],
-                }
-                
-                self.financials = {
-                    "dividend"          : float(dividend.amount),
-                    "dec_date"          : dividend.declaration_date,
-                    "rcd_date"          : dividend.record_date,
-                    "pay_date"          : dividend.payment_date,
-                    "annual_yield"      : float(overview['DividendYield']) * 100,
-                    "share_price"       : float(quote['05. price']),
-                    "target_price"      : overview['AnalystTargetPrice'],
-                    "book_value"        : float(overview['BookValue']),
-                    "beta"              : float(overview['Beta']),
-                }
-
-                self.articles           = news
-                self.sentiment          = api_functions.getSentimentScore(symbol)
-        
-        def getDividedFrequency(self, dividends):
-            # Dividend structure: [{amount, declaration_date, record_date, payment_date},...]
-            if not dividends:
+                self.build(symbol, overview, dividends, quote, news)
+
+        async def getDataAsync(self, config, symbol=None):
+            # getData for the ASGI server: the same calls awaited together on the event
+            # loop, no thread is held while upstream answers
+            if config['api_src'] != 'AlphaVantage':
+                return self.getData(config, symbol)
+            api_functions = divcalc_api.AsyncAlphaVantage(key=config['api_key'])
+
+            # Same as getData: all four together, then the overview decides
+            overview, dividends, quote, news = await asyncio.gather(
+                api_functions.getOverview(symbol),
+                divcalc_store.dividendHistoryAsync(symbol, api_functions),
+                api_functions.getQuote(symbol),
+                api_functions.getNewsSentiment(symbol),
+                return_exceptions=True)
+
+            if isinstance(overview, BaseException):
+                raise overview
+            if overview == {} or 'Error Message' in overview:
                 return None
-                        
-            dividend_frequency = None
-            if len(dividends) >= 1:
-                # Calculate dividend frequency
-                years = [parser.parse(d['payment_date']).year for d in dividends if len(d['payment_date']) == 10]
-                year_counts = Counter(years)
-                
-                # Determine the most common frequency
-                most_common_year, most_common_count = year_counts.most_common(1)[0]
 
-                current_year = datetime.datetime.now().year
-                
-                # Check if the current year is in the year_counts
-                if current_year in year_counts:
-                    current_year_count = year_counts[current_year]
-                    # Adjust the most common year and count if the current year has more counts
-                    if current_year_count > most_common_count:
-                        most_common_year = current_year
-                        most_common_count = current_year_count
-                
-                # Map the count to frequency
-                if most_common_count >= 12:
-                    dividend_frequency = 'Monthly'
-                elif most_common_count >= 4:
-                    dividend_frequency = 'Quarterly'
-                elif most_common_count >= 2:
-                    dividend_frequency = 'Semiannual'
-                elif most_common_count >= 1:
-                    dividend_frequency = 'Annual'
-                else:
-                    # No dividend history
-                    dividend_frequency = None
+            for result in (dividends, quote):
+                if isinstance(result, BaseException):
+                    raise result
+            if isinstance(news, BaseException):
+                news = {}
+
+            self.build(symbol, overview, dividends, quote, news)
+
+        def build(self, symbol, overview, dividends, quote, news):
+            # Fetched payloads -> model, dividends is (records, analytics) from divcalc_store
+
+            ########################################################
+            #
+            # Dividend History
+            #
+            ########################################################
+
+            # Historical is ordered newest -> oldest
+            # Create Dividend objects, this is the only place the date strings get parsed
+            self.dividend_history = []
             
-            return dividend_frequency
-                
-           
+            records, self.dividend_analytics = dividends
+            with divcalc_metrics.timed('parse'):
+                for d in records:
+                    dividend = Dividend(
+                        amount=d['amount'], 
+                        payment_date=d['payment_date'], 
+                        declaration_date=d.get('declaration_date'), 
+                        record_date=d.get('record_date'))
+                    # Skip records without a usable payment date
+                    if dividend.payment_date is not None:
+                        self.dividend_history.append(dividend)
+            # First is newest in AplhaVantage
+            if not self.dividend_history:
+                raise NoDividendsError(f'No dividend history for {symbol}')
+            dividend  = self.dividend_history[0]
+
+            # Frequency, payout growth and cuts come precomputed with the history
+            self.dividend_frequency = self.dividend_analytics['frequency']
+            
+            self.profile = {
+                "stock_symbol"      : symbol,
+                "company_name"      : overview['Name'],
+                "company_desc"      : overview['Description'],
+                "company_website"   : overview['OfficialSite'],
+                "stock_sector"      : overview['Sector'],
+                "stock_industry"    : overview['Industry'],
+                "exchange"          : overview['Exchange'],
+            }
+            
+            self.financials = {
+                "dividend"          : float(dividend.amount),
+                "dec_date"          : dividend.declaration_date,
+                "rcd_date"          : dividend.record_date,
+                "pay_date"          : dividend.payment_date,
+                "annual_yield"      : float(overview['DividendYield']) * 100,
+                "share_price"       : float(quote['05. price']),
+                "target_price"      : overview['AnalystTargetPrice'],
+                "book_value"        : float(overview['BookValue']),
+                "beta"              : float(overview['Beta']),
+            }
+
+            self.articles           = news
+            self.sentiment          = divcalc_api.sentimentScore(news, symbol)
+        
+        def toDict(self):
+            # Searched data only (no config), JSON friendly for the model cache
+            return {
+                'profile'           : self.profile,
+                'financials'        : {k: v.isoformat() if isinstance(v, datetime.date) else v
+                                       for k, v in self.financials.items()},
+                'dividend_history'  : [d.toDict() for d in self.dividend_history],
+                'dividend_frequency': self.dividend_frequency,
+                'dividend_analytics': self.dividend_analytics,
+            }
+
+        @classmethod
+        def fromDict(cls, data):
+            # Fresh instance every time, callers go on to modify config
+            data_model = cls()
+            data_model.profile              = dict(data['profile'])
+            data_model.financials           = dict(data['financials'])
+            data_model.dividend_history     = [Dividend(**d) for d in data['dividend_history']]
+            data_model.dividend_frequency   = data['dividend_frequency']
+            data_model.dividend_analytics   = data.get('dividend_analytics')
+            return data_model
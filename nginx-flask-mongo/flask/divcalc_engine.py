@@ -0,0 +1,206 @@
+import math
+
+import numpy as np
+
+###########################################################
+#
+# Array backed simulation math
+# Calculator.run (loop) is the reference implementation,
+# everything here must agree with it within float tolerance
+#
+###########################################################
+
+def pricePath(share_price, volatility, periods, rng=None):
+    # Constant price unless volatile
+    if volatility <= 0:
+        return np.full(periods, float(share_price))
+
+    # Same +/- band as the loop, compounded period over period
+    if rng is None:
+        rng = np.random.default_rng()
+    spread = abs(volatility - 1) / 100
+    steps = rng.uniform(1 - spread, 1 + spread, periods)
+    return np.round(share_price * np.cumprod(steps), 4)
+
+
+def fractionalPath(shares_owned, share_price, distribution, contribution):
+    # Fractional purchases spend the whole balance every period, so
+    #   shares[t] = shares[t-1] * (1 + distribution / price[t]) + contribution / price[t]
+    # which unrolls into a cumulative product/sum over the price array
+    growth = 1.0 + distribution / share_price
+    scale = np.cumprod(growth)
+    return scale * (shares_owned + np.cumsum((contribution / share_price) / scale))
+
+
+def fractionalClosedForm(shares_owned, share_price, distribution, contribution, periods):
+    # Flat price fractional runs in O(1) for any period (scalar or array).
+    # With rate = d/p and step = c/p the recurrence is
+    #   shares[n] = shares[n-1] * (1 + rate) + step
+    # so with G = sum((1 + rate)^t, t < n) = ((1 + rate)^n - 1) / rate
+    #   shares[n]  = shares[0] + (shares[0] * rate + step) * G
+    #   reinvested = d * sum(shares[t], t < n) = d * shares[0] * G + c * (G - n)
+    # expm1/log1p keep G accurate when the rate is tiny
+    rate = distribution / share_price
+    if np.ndim(periods) == 0:
+        # Single period (totals) in plain floats, numpy's per-call overhead dominates here
+        periods = float(periods)
+        if rate == 0:
+            growth = periods
+            excess = 0.0
+        else:
+            growth = math.expm1(periods * math.log1p(rate)) / rate
+            excess = growthExcess(rate, periods) if periods * rate < 1 else growth - periods
+    elif rate == 0:
+        periods = np.asarray(periods, dtype=float)
+        growth = periods
+        excess = np.zeros_like(periods)
+    else:
+        periods = np.asarray(periods, dtype=float)
+        growth = np.expm1(periods * np.log1p(rate)) / rate
+        # G - n cancels while n * rate is small, sum its series there instead
+        excess = growth - periods
+        small = periods * rate < 1
+        if np.any(small):
+            excess = np.where(small, growthExcess(rate, np.where(small, periods, 0)), excess)
+    return {
+        "shares_owned"      : shares_owned + (shares_owned * rate + contribution / share_price) * growth,
+        "total_reinvested"  : distribution * shares_owned * growth + contribution * excess,
+    }
+
+
+def growthExcess(rate, periods):
+    # sum((1 + rate)^t - 1, t < n) = C(n,2) rate + C(n,3) rate^2 + ...
+    # Terms shrink at least factorially while n * rate < 1
+    term = periods * (periods - 1) / 2 * rate
+    total = term
+    for k in range(1, 40):
+        term = term * rate * (periods - k - 1) / (k + 2)
+        total = total + term
+        converged = abs(term) <= 1e-17 * abs(total)
+        if converged is True or (converged is not False and converged.all()):
+            break
+    return total
+
+
+def monteCarlo(shares_owned, balance, share_price, distribution, contribution, volatility, periods,
+               purchase_mode='Fractional', paths=1000, seed=None, percentiles=(5, 50, 95), final=False):
+    # Simulate a periods x paths grid of price walks in one call and
+    # reduce it to percentile bands of asset value and income per period.
+    # Paths run along the contiguous axis, so each period is one vector op
+    # across every path and the per-period sorts stay cache friendly.
+    # final=True keeps (and sorts) only the last period, for goal seeking
+    rng = np.random.default_rng(seed)
+    spread = abs(volatility - 1) / 100
+    prices = rng.uniform(1 - spread, 1 + spread, (periods, paths))
+    prices[0] *= share_price
+
+    owned = np.empty((1 if final else periods, paths))
+    shares = np.full(paths, float(shares_owned))
+    cash = np.full(paths, float(balance))
+    purchased = np.empty(paths)
+
+    for p in range(periods):
+        price = prices[p]
+        if p:
+            price *= prices[p - 1]
+
+        # Same order of operations as Calculator.run
+        cash += shares * distribution + contribution
+        np.divide(cash, price, out=purchased)
+        if purchase_mode != 'Fractional':
+            np.floor(purchased, out=purchased)
+        shares += purchased
+        cash -= purchased * price
+        if not final:
+            owned[p] = shares
+
+    if final:
+        owned[0] = shares
+        prices = prices[-1:]
+
+    # Asset value first, the band reduction sorts its grid in place
+    prices *= owned
+    # Income is linear in shares owned, so its bands come straight from the share bands
+    return {
+        "percentiles"   : list(percentiles),
+        "asset_value"   : percentileBands(prices, percentiles),
+        "income"        : percentileBands(owned, percentiles) * distribution,
+    }
+
+
+def percentileBands(grid, percentiles):
+    # Linear interpolation percentiles (numpy's default) per row.
+    # Sorts the grid in place, which is much faster than a multi-kth partition
+    grid.sort(axis=1)
+    position = np.asarray(percentiles, dtype=float) / 100 * (grid.shape[1] - 1)
+    lower = np.floor(position).astype(int)
+    upper = np.ceil(position).astype(int)
+    weight = position - lower
+    return (grid[:, lower] * (1 - weight) + grid[:, upper] * weight).T
+
+
+def portfolioPath(shares_owned, balance, share_price, distribution, contribution, volatility, pay, whole, seed=None):
+    # Every holding side by side on one monthly timeline, one vector op per month across all of them.
+    # pay is a months x holdings mask of each holding's dividend months: a holding only collects its
+    # dividend and contribution, moves price and buys in those months, so each column repeats
+    # Calculator.run for that holding. whole marks the holdings buying whole shares only
+    months, holdings = pay.shape
+    share_price = np.asarray(share_price, dtype=float)
+    distribution = np.asarray(distribution, dtype=float)
+    contribution = np.asarray(contribution, dtype=float)
+    volatility = np.asarray(volatility, dtype=float)
+
+    # Same compounded +/- band as pricePath, with a step of 1 outside a holding's dividend months
+    prices = None
+    if np.any(volatility > 0):
+        spread = np.where(volatility > 0, np.abs(volatility - 1) / 100, 0.0)
+        rng = np.random.default_rng(seed)
+        steps = rng.uniform(1 - spread, 1 + spread, (months, holdings))
+        steps[~pay] = 1.0
+        prices = np.round(share_price * np.cumprod(steps, axis=0), 4)
+
+    shares = np.array(shares_owned, dtype=float)
+    cash = np.array(balance, dtype=float)
+    reinvested = np.zeros(holdings)
+    dividend = np.empty(holdings)
+    purchased = np.empty(holdings)
+    paid = pay.astype(float)
+    active = pay.any(axis=1).tolist()
+
+    dividends = np.zeros(months)
+    asset_value = np.empty(months)
+    cash_total = np.empty(months)
+
+    price = share_price
+    for m in range(months):
+        if prices is not None:
+            price = prices[m]
+        if active[m]:
+            # Same order of operations as Calculator.run
+            np.multiply(shares, distribution, out=dividend)
+            dividend *= paid[m]
+            reinvested += dividend
+            cash += dividend + contribution * paid[m]
+            np.divide(cash, price, out=purchased)
+            purchased *= paid[m]
+            np.floor(purchased, out=purchased, where=whole)
+            shares += purchased
+            cash -= purchased * price
+            dividends[m] = dividend.sum()
+        elif m:
+            # Nothing pays, nothing moves
+            asset_value[m] = asset_value[m - 1]
+            cash_total[m] = cash_total[m - 1]
+            continue
+        asset_value[m] = shares @ price
+        cash_total[m] = cash.sum()
+
+    return {
+        "shares_owned"      : shares,
+        "cash"              : cash,
+        "share_price"       : price.copy(),
+        "total_reinvested"  : reinvested,
+        "dividends"         : dividends,
+        "asset_value"       : asset_value,
+        "cash_total"        : cash_total,
+    }
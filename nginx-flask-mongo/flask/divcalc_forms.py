@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, IntegerField, DecimalField, TextAreaField, SubmitField, SelectField, HiddenField
-from wtforms.validators import DataRequired, Length, NumberRange    
+from wtforms.validators import DataRequired, Length, NumberRange, Optional
 
 class DivCalcForm(FlaskForm):
     source          = HiddenField()
@@ -21,6 +21,11 @@ class DivCalcForm(FlaskForm):
     purchase_mode   = SelectField( choices=[
                                       ('Fractional', 'Fractional'),
                                       ('Modulus', 'Modulus'),])
+    engine          = SelectField( choices=[
+                                      ('Vectorized', 'Vectorized'),
+                                      ('Loop', 'Loop'),])
+    paths           = IntegerField(default=1000,    validators=[NumberRange(min=1, max=20000)])
+    seed            = IntegerField(validators=[Optional()])
     run             = SubmitField()
 
 class StockSettingsForm(FlaskForm):
@@ -0,0 +1,154 @@
+import math
+
+from divcalc_data import DataModel, Calculator, frequency_map
+
+###########################################################
+#
+# Goal seek: the contribution, initial capital or term that
+# reaches a target income_annual or ending_assets.
+# Every evaluation uses the fastest engine for the config:
+#   closed form - flat price, fractional
+#   loop        - flat price, whole shares
+#   monte carlo - volatile, a percentile of the final period
+#
+###########################################################
+
+solve_params = ('contribution', 'initial_capital', 'term')
+solve_targets = ('income_annual', 'ending_assets')
+
+# Money is solved to the cent, terms to whole years
+tolerance = 0.01
+max_term = 200
+max_iterations = 100
+
+
+class GoalError(Exception):
+    pass
+
+
+class Objective:
+    # Target metric as a function of one config value, counts its evaluations
+    def __init__(self, config, solve_for, target, percentile=50):
+        self.config = dict(config)
+        self.solve_for = solve_for
+        self.target = target
+        self.percentile = percentile
+        self.evaluations = 0
+
+        if self.config['volatility'] > 0:
+            self.engine = 'monte_carlo'
+            # Same paths for every evaluation, otherwise the objective is noise
+            if self.config.get('seed') is None:
+                self.config['seed'] = 0
+        elif self.config['purchase_mode'] == 'Fractional':
+            self.engine = 'closed_form'
+        else:
+            self.engine = 'loop'
+            self.config['engine'] = 'Loop'
+
+    def __call__(self, value):
+        self.evaluations += 1
+        data_model = DataModel()
+        data_model.config.update(self.config)
+        data_model.config[self.solve_for] = value
+        calc = Calculator(data_model)
+
+        if self.engine == 'monte_carlo':
+            bands = calc.runMonteCarlo(percentiles=(self.percentile,), final=True)
+            if self.target == 'income_annual':
+                return float(bands['income'][0, 0]) * frequency_map[self.config['frequency']]
+            return float(bands['asset_value'][0, 0])
+
+        calc.runTotals(cache=False)
+        return calc.totals[self.target]
+
+
+def solveMoney(objective, goal):
+    # Bracket the root by growing hi, then false position (Illinois) with a
+    # bisection step whenever the bracket stops halving. Step functions
+    # (whole share purchases) still converge through the bisection steps
+    lo, f_lo = 0.0, objective(0.0) - goal
+    if f_lo >= 0:
+        return 0.0
+
+    hi = 1000.0
+    f_hi = objective(hi) - goal
+    while f_hi < 0:
+        if hi > 1e12:
+            raise GoalError('Target not reachable')
+        lo, f_lo = hi, f_hi
+        hi *= 4
+        f_hi = objective(hi) - goal
+
+    side = 0
+    slow = 0
+    for _ in range(max_iterations):
+        width = hi - lo
+        if width <= tolerance:
+            break
+
+        if slow >= 2 or f_hi == f_lo:
+            mid = lo + width / 2
+        else:
+            mid = lo - f_lo * width / (f_hi - f_lo)
+            # Stay strictly inside, false position can stall on an end
+            mid = min(max(mid, lo + tolerance / 4), hi - tolerance / 4)
+        f_mid = objective(mid) - goal
+
+        if f_mid >= 0:
+            hi, f_hi = mid, f_mid
+            if side == 1:
+                f_lo /= 2
+            side = 1
+        else:
+            lo, f_lo = mid, f_mid
+            if side == -1:
+                f_hi /= 2
+            side = -1
+        slow = slow + 1 if hi - lo > width / 2 else 0
+
+    # Smallest whole cent that still reaches the target
+    value = math.ceil(hi * 100) / 100
+    while value >= 0.01 and objective(value - 0.01) >= goal:
+        value = round(value - 0.01, 2)
+    return value
+
+
+def solveTerm(objective, goal):
+    # Smallest whole term reaching the target: gallop up, then binary search
+    if objective(1) >= goal:
+        return 1
+    lo, hi = 1, 2
+    while objective(hi) < goal:
+        if hi >= max_term:
+            raise GoalError(f'Target not reachable within {max_term} years')
+        lo, hi = hi, min(hi * 2, max_term)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if objective(mid) >= goal:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def solve(config, solve_for, target, goal, percentile=50):
+    objective = Objective(config, solve_for, target, percentile)
+    if solve_for == 'term':
+        value = solveTerm(objective, goal)
+    else:
+        value = solveMoney(objective, goal)
+
+    result = {
+        'solve_for'     : solve_for,
+        'value'         : value,
+        'target'        : target,
+        'goal'          : goal,
+        'achieved'      : objective(value),
+        'engine'        : objective.engine,
+        'evaluations'   : objective.evaluations,
+    }
+    if objective.engine == 'monte_carlo':
+        result['percentile'] = percentile
+        result['seed'] = objective.config['seed']
+    return result
@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import nullcontext
+
+###########################################################
+#
+# Opt-in request timing, DIVCALC_METRICS=1 turns it on
+# Per request stages -> Server-Timing response header
+# Per process histograms -> Prometheus text on /metrics
+# Disabled, timed() hands back one shared no-op context
+# and the server registers no hooks at all
+#
+###########################################################
+
+enabled = os.environ.get('DIVCALC_METRICS') == '1'
+
+# Seconds, upper bounds of the histogram buckets (+Inf is implied)
+buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    # Prometheus style histogram with one label, safe to share between request threads
+    def __init__(self, name, label, description):
+        self.name = name
+        self.label = label
+        self.description = description
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, value):
+        with self.lock:
+            series = self.series.get(value)
+            if series is None:
+                series = self.series[value] = [[0] * (len(buckets) + 1), 0.0]
+            series[0][bisect_left(buckets, seconds)] += 1
+            series[1] += seconds
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {value: (list(counts), total) for value, (counts, total) in self.series.items()}
+        for value, (counts, total) in sorted(series.items()):
+            label = '%s="%s"' % (self.label, value.replace('\\', '\\\\').replace('"', '\\"'))
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return lines
+
+
+stage_seconds = Histogram('divcalc_stage_seconds', 'stage', 'Time spent in each request stage')
+request_seconds = Histogram('divcalc_request_seconds', 'route', 'Request time up to the last body byte')
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []
+        self.rendering = {}
+
+
+# The current request's timings, None outside a request
+request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def record(stage, seconds):
+    stage_seconds.observe(seconds, stage)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.stages.append((stage, seconds))
+
+
+class Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.start)
+
+
+null_timer = nullcontext()
+
+
+def timed(stage):
+    # with divcalc_metrics.timed('calc'): ...
+    if not enabled:
+        return null_timer
+    return Timer(stage)
+
+
+def bind(function):
+    # Pool threads don't inherit the request's context, carry it over so their stages land in the same request
+    if not enabled:
+        return function
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(function, *args, **kwargs)
+
+
+def renderStarted(sender, template, context, **extra):
+    # Flask before_render_template / template_rendered signals. A streamed
+    # template is "rendered" once its last chunk is out, so it is wall time
+    timings = request_timings.get()
+    if timings is not None:
+        timings.rendering[template.name] = time.perf_counter()
+
+
+def renderFinished(sender, template, context, **extra):
+    timings = request_timings.get()
+    if timings is not None and template.name in timings.rendering:
+        name = template.name.rsplit('.', 1)[0]
+        record(f'render_{name}', time.perf_counter() - timings.rendering.pop(template.name))
+
+
+def serverTiming():
+    # Stages so far plus the app time up to the headers, e.g. "upstream_overview;dur=41.20, app;dur=48.73"
+    timings = request_timings.get()
+    if timings is None:
+        return None
+    stages = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in timings.stages]
+    stages.append(f'app;dur={(time.perf_counter() - timings.start) * 1000:.2f}')
+    return ', '.join(stages)
+
+
+class RequestTimer:
+    # WSGI middleware, opens the request's timings and observes the whole request,
+    # streamed bodies included. The route label comes from environ['divcalc.route']
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        timings = RequestTimings()
+        request_timings.set(timings)
+        body = self.app(environ, start_response)
+        try:
+            yield from body
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            request_seconds.observe(time.perf_counter() - timings.start, environ.get('divcalc.route', 'unmatched'))
+            # A body closed late (dropped client, garbage collected) must not clear a newer request's timings
+            if request_timings.get() is timings:
+                request_timings.set(None)
+
+
+def exposition():
+    # Counters are per process, every gunicorn worker reports its own
+    return '\n'.join(request_seconds.exposition() + stage_seconds.exposition()) + '\n'
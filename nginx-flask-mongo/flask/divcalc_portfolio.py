@@ -0,0 +1,162 @@
+import os
+import math
+
+import numpy as np
+
+import divcalc_engine
+from divcalc_data import frequency_map, months_map
+
+###########################################################
+#
+# Portfolio: many holdings simulated together on a shared
+# monthly timeline in one batched array computation.
+# Each holding keeps its own price, distribution, payment
+# frequency and purchase mode, and its contribution lands
+# in its dividend months, like a single report
+#
+###########################################################
+
+max_holdings = int(os.environ.get('DIVCALC_PORTFOLIO_HOLDINGS', 1000))
+max_term = 100
+
+holding_keys = ('symbol', 'share_price', 'distribution', 'frequency', 'purchase_mode',
+                'shares_owned', 'initial_capital', 'contribution', 'volatility')
+required_keys = ('share_price', 'distribution', 'frequency', 'purchase_mode')
+holding_defaults = {
+    'shares_owned'      : 0.0,
+    'initial_capital'   : 0.0,
+    'contribution'      : 0.0,
+    'volatility'        : 0.0,
+}
+
+# Calendar months each frequency pays in, the same months the report rows use
+pay_months = {frequency: np.isin(months_map[12], months_map[n]) for frequency, n in frequency_map.items()}
+
+
+class PortfolioError(Exception):
+    pass
+
+
+def checkHolding(i, holding):
+    if not isinstance(holding, dict):
+        raise PortfolioError(f'Holding {i} must be an object')
+    unknown = [k for k in holding if k not in holding_keys]
+    missing = [k for k in required_keys if k not in holding]
+    if unknown or missing:
+        raise PortfolioError(f'Holding {i}: unknown {unknown}, missing {missing}')
+    if holding['frequency'] not in frequency_map:
+        raise PortfolioError(f'Holding {i}: frequency must be one of {list(frequency_map)}')
+    if holding['purchase_mode'] not in ('Fractional', 'Modulus'):
+        raise PortfolioError(f'Holding {i}: purchase_mode must be Fractional or Modulus')
+    for k in holding_keys[5:] + ('share_price', 'distribution'):
+        value = holding.get(k, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+            raise PortfolioError(f'Holding {i}: {k} must be a non-negative number')
+    if holding['share_price'] <= 0:
+        raise PortfolioError(f'Holding {i}: share_price must be positive')
+
+
+def checkRequest(holdings, term, seed):
+    # Request level checks, cheap enough to run before any symbol is loaded
+    if not isinstance(holdings, list) or not 1 <= len(holdings) <= max_holdings:
+        raise PortfolioError(f'Expected 1-{max_holdings} holdings')
+    if isinstance(term, bool) or not isinstance(term, int) or not 1 <= term <= max_term:
+        raise PortfolioError(f'term must be a whole number of years within 1-{max_term}')
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+        raise PortfolioError('seed must be a whole number')
+
+
+def simulate(holdings, term, seed=None, series=True):
+    checkRequest(holdings, term, seed)
+    for i, holding in enumerate(holdings):
+        checkHolding(i, holding)
+
+    holdings = [dict(holding_defaults, **h) for h in holdings]
+    column = lambda k: np.array([h[k] for h in holdings], dtype=float)
+    share_price = column('share_price')
+    distribution = column('distribution')
+    contribution = column('contribution')
+    initial_capital = column('initial_capital')
+    income_sequence = np.array([frequency_map[h['frequency']] for h in holdings])
+    whole = np.array([h['purchase_mode'] != 'Fractional' for h in holdings])
+
+    # Opening position, same as Calculator.run
+    bought = initial_capital / share_price
+    np.floor(bought, out=bought, where=whole)
+    initial_shares = column('shares_owned') + bought
+    balance = np.where(whole, initial_capital - bought * share_price, 0.0)
+
+    months = term * 12
+    pay = np.tile(np.stack([pay_months[h['frequency']] for h in holdings], axis=1), (term, 1))
+    path = divcalc_engine.portfolioPath(initial_shares, balance, share_price, distribution, contribution,
+                                        column('volatility'), pay, whole, seed)
+
+    ###########################################################
+    # Per holding totals, the same fields as Calculator.totals
+    ###########################################################
+    periods = term * income_sequence
+    owned = path['shares_owned']
+    starting_distribution = initial_shares * distribution
+    ending_distribution = owned * distribution
+    growth = ending_distribution - starting_distribution
+    growth_pct = np.zeros(len(holdings))
+    np.divide(100 * growth, starting_distribution, out=growth_pct, where=(growth > 0) & (starting_distribution > 0))
+
+    totals = {
+        "initial_capital"           : initial_capital,
+        "contributions"             : contribution * periods,
+        "initial_shares"            : initial_shares,
+        "starting_assets"           : initial_shares * share_price,
+        "starting_distribution"     : starting_distribution,
+        "total_reinvested"          : path['total_reinvested'],
+        "periods"                   : periods,
+        "years_vested"              : np.full(len(holdings), term),
+        "investment_tot"            : initial_capital + contribution * periods,
+        "cash"                      : path['cash'],
+        "shares_owned"              : owned,
+        "ending_share_price"        : path['share_price'],
+        "ending_assets"             : owned * path['share_price'],
+        "ending_distribution"       : ending_distribution,
+        "distribution_growth_tot"   : growth,
+        "distribution_growth_pct"   : growth_pct,
+        "distribution_growth_avg"   : growth / term,
+        "income_annual"             : ending_distribution * income_sequence,
+    }
+    names = list(totals)
+    per_holding = [dict(zip(names, values)) for values in zip(*(totals[k].tolist() for k in names))]
+    for h, row in zip(holdings, per_holding):
+        if 'symbol' in h:
+            row['symbol'] = h['symbol']
+
+    ###########################################################
+    # Portfolio totals
+    ###########################################################
+    starting_income = float(starting_distribution @ income_sequence)
+    income_annual = float(totals['income_annual'].sum())
+    portfolio = {
+        "holdings"                  : len(holdings),
+        "months"                    : months,
+        "years_vested"              : term,
+        "initial_capital"           : float(initial_capital.sum()),
+        "contributions"             : float(totals['contributions'].sum()),
+        "investment_tot"            : float(totals['investment_tot'].sum()),
+        "total_reinvested"          : float(path['total_reinvested'].sum()),
+        "starting_assets"           : float(totals['starting_assets'].sum()),
+        "ending_assets"             : float(totals['ending_assets'].sum()),
+        "cash"                      : float(path['cash'].sum()),
+        "starting_income_annual"    : starting_income,
+        "income_annual"             : income_annual,
+        "income_growth_pct"         : 100 * (income_annual - starting_income) / starting_income if starting_income > 0 else 0,
+    }
+
+    result = {'totals': portfolio, 'holdings': per_holding}
+    if series:
+        # Whole portfolio per month
+        result['series'] = {
+            "month"         : list(range(1, months + 1)),
+            "dividends"     : path['dividends'].tolist(),
+            "contributions" : (pay @ contribution).tolist(),
+            "asset_value"   : path['asset_value'].tolist(),
+            "cash"          : path['cash_total'].tolist(),
+        }
+    return result
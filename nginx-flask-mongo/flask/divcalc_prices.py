@@ -0,0 +1,127 @@
+import os
+import time
+import tempfile
+import threading
+
+import numpy as np
+
+###########################################################
+#
+# Daily price cache, one .npy file per symbol holding
+# (date, open, close) rows, oldest first.
+# Files are memory mapped: a backtest only touches the
+# pages it reads and every worker shares the OS page cache.
+# A first load pulls the full TIME_SERIES_DAILY history,
+# later refreshes only the last 100 trading days
+#
+###########################################################
+
+price_dtype = np.dtype([('date', 'datetime64[D]'), ('open', 'f8'), ('close', 'f8')])
+
+
+def validSymbol(symbol):
+    # Symbols become file names, letters/digits with inner '.' or '-' only (BRK.B, RDS-A)
+    return bool(symbol) and symbol[0].isalnum() and all(c.isalnum() or c in '.-' for c in symbol)
+
+
+def parseDaily(payload):
+    # AlphaVantage daily series -> price rows. Errors and rate limit notes parse to no rows
+    series = payload.get('Time Series (Daily)') or {}
+    prices = np.empty(len(series), dtype=price_dtype)
+    prices['date'] = np.array(list(series), dtype='datetime64[D]')
+    prices['open'] = [float(v['1. open']) for v in series.values()]
+    prices['close'] = [float(v['4. close']) for v in series.values()]
+    prices.sort(order='date')
+    return prices
+
+
+class PriceCache:
+    def __init__(self, directory, refresh_interval=12 * 60 * 60):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        # symbol -> (file mtime, mapped array), reopened when another worker replaces the file
+        self.mapped = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, symbol):
+        if not validSymbol(symbol):
+            raise ValueError(f'Invalid symbol {symbol!r}')
+        return os.path.join(self.directory, f'{symbol}.npy')
+
+    def load(self, symbol):
+        path = self.path(symbol)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None, None
+        with self.lock:
+            entry = self.mapped.get(symbol)
+            if entry is None or entry[0] != mtime:
+                entry = self.mapped[symbol] = (mtime, np.load(path, mmap_mode='r'))
+        return entry
+
+    def save(self, symbol, prices):
+        # Write then rename, readers keep the old mapping until they reopen
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, prices)
+        os.replace(tmp, self.path(symbol))
+
+    def prices(self, symbol, api_functions=None):
+        # Mapped price rows for the symbol, None when not cached and nothing to fetch with.
+        # Stale files are still served when there is no API key to refresh them
+        mtime, prices = self.load(symbol)
+        if prices is not None and (api_functions is None or time.time() - mtime < self.refresh_interval):
+            self.hits += 1
+            return prices
+        if api_functions is None:
+            return None
+        self.misses += 1
+
+        fresh = None
+        if prices is not None:
+            recent = parseDaily(api_functions.getDailyPrices(symbol, full=False))
+            # Only stitch when the window overlaps what's cached, otherwise reload it all
+            if len(recent) and recent['date'][0] <= prices['date'][-1]:
+                fresh = np.concatenate((prices[prices['date'] < recent['date'][0]], recent))
+        if fresh is None:
+            fresh = parseDaily(api_functions.getDailyPrices(symbol, full=True))
+        if len(fresh) == 0:
+            return prices
+
+        # Saved even when nothing changed, the new mtime restarts the refresh interval
+        self.save(symbol, fresh)
+        return self.load(symbol)[1]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend"   : 'npy',
+            "directory" : self.directory,
+            "size"      : len(self.mapped),
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "hit_rate"  : self.hits / lookups if lookups else 0.0,
+        }
+
+
+price_cache = PriceCache(os.environ.get('DIVCALC_PRICE_CACHE', os.path.join(tempfile.gettempdir(), 'divcalc_prices')),
+                         int(os.environ.get('DIVCALC_PRICE_REFRESH', 12 * 60 * 60)))
+
+
+def attachPrices(dividends, prices):
+    # Open/close of the trading day each dividend was paid on (the last one before it for holidays)
+    paid = [d for d in dividends if d.payment_date is not None]
+    if not paid or prices is None or len(prices) == 0:
+        return
+    index = np.searchsorted(prices['date'], np.array([d.payment_date for d in paid], dtype='datetime64[D]'), side='right') - 1
+    opens = prices['open'][np.maximum(index, 0)].tolist()
+    closes = prices['close'][np.maximum(index, 0)].tolist()
+    for d, i, o, c in zip(paid, index.tolist(), opens, closes):
+        if i >= 0:
+            d.open_price = o
+            d.close_price = c
@@ -2,19 +2,38 @@
 
 # System
 import os
+import json
+import math
+import secrets
+import threading
 from decimal import *
+from itertools import islice
 #import authlib
-from collections import deque
-# Mongo
-from pymongo import MongoClient
 
 # Flask
-from flask              import Flask, request, session, render_template, redirect
+from flask              import Flask, Response, request, session, render_template, stream_template, redirect
+from flask              import before_render_template, template_rendered
 from flask_bootstrap    import Bootstrap5
+from flask.sessions     import SessionInterface
 from flask_session      import Session
 from flask_wtf          import CSRFProtect
+from cachelib           import SimpleCache
+from markupsafe         import escape
 
 # Local
+import divcalc_api
+import divcalc_backtest
+import divcalc_cache
+import divcalc_data
+import divcalc_export
+import divcalc_goal
+import divcalc_metrics
+import divcalc_portfolio
+import divcalc_prices
+import divcalc_simulate
+import divcalc_store
+import divcalc_sweep
+import divcalc_watch
 from divcalc_data   import DataModel, Dividend, Calculator
 from divcalc_forms  import StockSettingsForm, APISettingsForm, DivCalcForm, LoginForm
 
@@ -27,28 +46,286 @@ app_info = {
 # Config
 app = Flask(__name__)
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+
+# Session backend: filesystem (default), memory (single process) or mongo (shared by all workers)
+session_backend = os.environ.get('DIVCALC_SESSION', 'filesystem')
+if session_backend == 'mongo':
+    app.config["SESSION_TYPE"] = "mongodb"
+    app.config["SESSION_MONGODB_DB"] = os.environ.get('MONGO_DB', 'divcalc')
+elif session_backend == 'memory':
+    app.config["SESSION_TYPE"] = "cachelib"
+    app.config["SESSION_CACHELIB"] = SimpleCache(threshold=int(os.environ.get('DIVCALC_SESSION_SIZE', 5000)))
+else:
+    app.config["SESSION_TYPE"] = "filesystem"
+
+# Mongo's interface connects when made, so it's left to the first request of each process
+if session_backend != 'mongo':
+    Session(app)
+
+def sessionInterface():
+    if session_backend == 'mongo':
+        from flask_session.mongodb import MongoDBSessionInterface
+        return MongoDBSessionInterface(app,
+                                       client=divcalc_cache.mongoDatabase().client,
+                                       db=app.config["SESSION_MONGODB_DB"],
+                                       permanent=app.config["SESSION_PERMANENT"])
+    return session_interface
+
+class SessionlessPaths(SessionInterface):
+    # The JSON API is stateless, skip the backend load/save for its paths.
+    # Null sessions are never saved, everything else goes to the real backend,
+    # made once per process by createInterface (gunicorn workers fork after import)
+    def __init__(self, createInterface, prefixes):
+        self.createInterface = createInterface
+        self.prefixes = prefixes
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.backend(), name)
+
+    def backend(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.interface = self.createInterface()
+                    self.pid = os.getpid()
+        return self.interface
+
+    def open_session(self, app, request):
+        if request.path.startswith(self.prefixes):
+            return self.make_null_session(app)
+        with divcalc_metrics.timed('session_load'):
+            return self.backend().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        # Saved after the response headers are built, so only in /metrics, never in Server-Timing
+        with divcalc_metrics.timed('session_save'):
+            return self.backend().save_session(app, session, response)
+
+session_interface = app.session_interface
+app.session_interface = SessionlessPaths(sessionInterface, ('/api/',))
+
+# Searched models, keyed on (api_src, symbol). The session only keeps the symbol
+model_cache = divcalc_cache.createCache('models', maxsize=int(os.environ.get('DIVCALC_MODEL_CACHE_SIZE', 256)))
+model_ttl = int(os.environ.get('DIVCALC_MODEL_TTL', 60 * 60))
+
+def afterFork():
+    # Gunicorn post_fork hook. The app is imported once in the master, so every
+    # client it created (Mongo, the AlphaVantage pool) is dropped and reconnects per worker
+    divcalc_cache.resetClient()
+    for cache in (divcalc_api.response_cache, model_cache):
+        if isinstance(cache, divcalc_cache.MongoCache):
+            cache.reset()
+    if divcalc_store.dividend_store is not None:
+        divcalc_store.dividend_store.reset()
+    divcalc_watch.watchlist.reset()
+    divcalc_api.http_session = divcalc_api.createSession()
 
 #FIXME Maybe include a vault?
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev")
 
 bootstrap = Bootstrap5(app)
 csrf = CSRFProtect(app)
-#client = MongoClient("mongo:27017")
+
+# Widget fragments that only depend on app_info and url_for, keyed on (name, script root).
+# {% call fragment('name') %} ... {% endcall %} renders the body once, later requests reuse it.
+# Static chrome only: form fields, the session and anything else per request stay outside
+fragment_cache = {}
+
+@app.template_global()
+def fragment(name, caller):
+    # Templates reload on change in debug, so nothing is kept there
+    if app.jinja_env.auto_reload:
+        return caller()
+    key = (name, request.script_root)
+    html = fragment_cache.get(key)
+    if html is None:
+        html = fragment_cache[key] = caller()
+    return html
+
+# Request timing, only hooked in when DIVCALC_METRICS=1
+if divcalc_metrics.enabled:
+    app.wsgi_app = divcalc_metrics.RequestTimer(app.wsgi_app)
+    before_render_template.connect(divcalc_metrics.renderStarted, app)
+    template_rendered.connect(divcalc_metrics.renderFinished, app)
+
+    @app.after_request
+    def serverTiming(response):
+        request.environ['divcalc.route'] = request.url_rule.rule if request.url_rule else 'unmatched'
+        timing = divcalc_metrics.serverTiming()
+        if timing:
+            response.headers['Server-Timing'] = timing
+        return response
+
+# Watchlist refresh thread, started by each process' first request
+if divcalc_watch.enabled:
+    app.before_request(divcalc_watch.scheduler.start)
+
+# Config keys a JSON client must supply for a simulation
+required_config = ('term', 'initial_capital', 'shares_owned', 'contribution', 'share_price',
+                   'volatility', 'distribution', 'purchase_mode', 'frequency')
+
+config_keys = frozenset(DataModel().config)
+
+def configErrors(keys, provided):
+    # Unknown config keys, and required ones not provided
+    unknown = [k for k in keys if k not in config_keys]
+    missing = [k for k in required_config if k not in provided]
+    return unknown, missing
+
+# Monte Carlo paths per run, the form's range. Memory grows with paths x periods
+default_paths = 1000
+max_paths = 20000
+
+def pathsValue(value):
+    # Submitted paths -> 1..max_paths, the default when missing or not a whole number
+    try:
+        paths = int(value)
+    except (TypeError, ValueError):
+        return default_paths
+    return min(max(paths, 1), max_paths)
+
+# Simulation term in years, past it one request could run for minutes
+max_term = int(os.environ.get('DIVCALC_MAX_TERM', 100))
+
+number_config = ('initial_capital', 'shares_owned', 'contribution', 'share_price', 'volatility', 'distribution')
+config_choices = {
+    'frequency'         : tuple(divcalc_data.frequency_map),
+    'purchase_mode'     : ('Fractional', 'Modulus'),
+    'engine'            : (None, 'Vectorized', 'Loop'),
+}
+
+def isNumber(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def isWhole(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def configValueError(config):
+    # First value in a JSON config the calculator can't run, as a message. None when it's fine
+    for k in number_config:
+        if k in config and not (isNumber(config[k]) and config[k] >= 0):
+            return f'{k} must be a number >= 0'
+    if config.get('share_price') == 0:
+        return 'share_price must be above 0'
+    if 'term' in config and not (isWhole(config['term']) and 1 <= config['term'] <= max_term):
+        return f'term must be a whole number of years, 1-{max_term}'
+    if config.get('paths') is not None and not (isWhole(config['paths']) and 1 <= config['paths'] <= max_paths):
+        return f'paths must be a whole number, 1-{max_paths}'
+    if config.get('seed') is not None and not isWhole(config['seed']):
+        return 'seed must be a whole number'
+    for k, choices in config_choices.items():
+        if k in config and config[k] not in choices:
+            return f'{k} must be one of {", ".join(c for c in choices if c)}'
+    return None
+
+def dividendChart(data_model):
+    # History chart axes, oldest payment first
+    history = data_model.dividend_history[::-1]
+    return [d.payment_date.isoformat() for d in history], [d.amount for d in history]
+
+def reportFormError(data_model, settings_form, error):
+    # Back to the search page with the submitted values and what's wrong with them
+    div_dates, div_amounts = dividendChart(data_model)
+    return render_template('search.jinja',
+                           app_info    = app_info,
+                           model       = data_model,
+                           form        = settings_form,
+                           data        = data_model,
+                           div_dates   = div_dates,
+                           div_amounts = div_amounts,
+                           form_error  = error,
+                           ), 400
+
+def chunked(stream, parts=512):
+    # Jinja yields every tag and text run on its own, batch them into fewer, larger writes.
+    # The page head goes out on its own so the first byte never waits on a widget
+    stream = iter(stream)
+    yield next(stream, '')
+    while True:
+        batch = list(islice(stream, parts))
+        if not batch:
+            return
+        yield ''.join(batch)
+
+def loadModel(symbol, api_src=None, api_key=None):
+    # Cached search result for the API source (the session's by default), refetched if it was evicted
+    if api_src is None:
+        api_src, api_key = session.get('api_src'), session.get('api_key')
+    key = (api_src, symbol)
+    data_model_data = model_cache.get(key)
+    if data_model_data is not None:
+        return DataModel.fromDict(data_model_data)
+    if api_key is None and api_src == 'AlphaVantage':
+        return None
+
+    data_model = DataModel()
+    data_model.getData(config={'api_src': api_src, 'api_key': api_key}, symbol=symbol)
+    if data_model.profile.get('stock_symbol') is None:
+        return None
+    model_cache.set(key, data_model.toDict(), model_ttl)
+    return data_model
+
+def apiModel(symbol, api_key):
+    # loadModel for the JSON routes: (model, None), or (None, (error, status)) when upstream fails
+    try:
+        return loadModel(symbol, 'AlphaVantage', api_key), None
+    except divcalc_data.NoDividendsError as e:
+        return None, ({'error': str(e)}, 404)
+    except Exception:
+        app.logger.exception('Search upstream failed')
+        return None, ({'error': f'Upstream request failed for {symbol}'}, 502)
 
 @app.route('/', methods=['GET'])
 def index():
-    tab_div_header = render_template("tab_div_header.jinja", app_info=app_info)
-
     return render_template('index.jinja', 
-                           header = tab_div_header
+                           app_info = app_info
                            ), 200, {'ContentType':'text/html; charset=utf-8'} 
 
 @app.route('/export/<mode>', methods=['GET','POST'])
+@csrf.exempt
 def export(mode):
-    #FIXME
-    return render_template('report_csv.jinja'), 200, {'ContentType':'text/json; charset=utf-8'}
+
+    ###########################################################
+    # Streamed rows: csv or ndjson, gzip when the client accepts it.
+    # Scripts POST {"config": {...}}, the report page links GET the
+    # config of the last report in the session
+    ###########################################################
+    if mode not in divcalc_export.content_types:
+        return {'error': 'Unknown export mode', 'modes': list(divcalc_export.content_types)}, 400
+
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('config', {}), dict):
+            return {'error': 'Expected {"config": {...}}'}, 400
+        config = payload.get('config', {})
+        unknown, missing = configErrors(config, config)
+        if unknown or missing:
+            return {'error': 'Invalid export config', 'unknown': unknown, 'missing': missing}, 400
+    else:
+        config = session.get('report_config')
+        if config is None:
+            return redirect('/search', code=302, Response=None)
+
+    # Same term and paths bounds as /report, a volatile export holds paths x periods
+    error = configValueError(config)
+    if error:
+        return {'error': error}, 400
+
+    data_model = DataModel()
+    data_model.config.update(config)
+    calc = Calculator(data_model)
+
+    gzip = request.accept_encodings['gzip'] > 0
+    response = Response(divcalc_export.export(calc, mode, gzip), mimetype=divcalc_export.content_types[mode])
+    response.vary.add('Accept-Encoding')
+    if gzip:
+        response.content_encoding = 'gzip'
+    if mode == 'csv':
+        symbol = session.get('data_model') if request.method == 'GET' else None
+        response.headers['Content-Disposition'] = f'attachment; filename={symbol or "simulation"}.csv'
+    return response
 
 @app.route('/help', methods=['GET'])
 def help():
@@ -58,15 +335,51 @@ def help():
 
 @app.route('/history/', methods=['GET','POST'])
 def history():
-    #FIXME
-    return f'TODO: Add chart/data visual from alpha.getDividendHistory()'
+
+    # Symbol from the link/form, otherwise the last search
+    symbol = (request.values.get('stock_symbol') or session.get('data_model') or '').upper()
+    if symbol and not divcalc_prices.validSymbol(symbol):
+        return render_template('error.jinja', msg='<p> Invalid symbol</p>', app_info=app_info), 400
+
+    # Stored history is a local indexed read, no API call
+    dividends = []
+    if symbol and divcalc_store.dividend_store is not None:
+        dividends = [Dividend(amount           = d['amount'],
+                              payment_date     = d['payment_date'],
+                              declaration_date = d.get('declaration_date'),
+                              record_date      = d.get('record_date'))
+                     for d in divcalc_store.dividend_store.history(symbol)]
+    elif symbol:
+        # Only what this session's API source already searched, no fetch from here
+        data_model_data = model_cache.get((session.get('api_src'), symbol))
+        if data_model_data is not None:
+            dividends = DataModel.fromDict(data_model_data).dividend_history
+
+    if not dividends:
+        msg = '<p> No stored dividend history for: {symbol}</p><p> Search the symbol first to load it.</p>'.format(symbol=escape(symbol))
+        return render_template('error.jinja', msg=msg, app_info=app_info)
+
+    data_model = DataModel()
+    data_model.profile['stock_symbol'] = symbol
+    data_model.dividend_history = dividends
+
+    # Chart Axes, oldest -> newest
+    div_dates   = [d.payment_date.isoformat() for d in dividends[::-1]]
+    div_amounts = [d.amount for d in dividends[::-1]]
+
+    # Page and widgets render in one pass
+    return render_template('history.jinja',
+                           app_info    = app_info,
+                           div_dates   = div_dates,
+                           div_amounts = div_amounts,
+                           model       = data_model,
+                           ), 200, {'ContentType':'text/html; charset=utf-8'}
 
 @app.route("/login", methods=["POST", "GET"])
 def login():
     
     if request.method == 'GET':
-        tab_div_login = render_template("tab_div_login.jinja", login_form=LoginForm())
-        return render_template('login.jinja', login=tab_div_login )
+        return render_template('login.jinja', login_form=LoginForm())
     
     if request.method == 'POST':
         #FIXME
@@ -77,16 +390,14 @@ def login():
         if session["username"] != None:
             return redirect('/')
         else:
-            tab_div_login = render_template("tab_div_login.jinja", login_form=LoginForm())
-            return render_template('login.jinja', login=tab_div_login )
+            return render_template('login.jinja', login_form=LoginForm())
 
 @app.route("/logout", methods=["GET"])
 def logout():
 
     session["username"] = None
         
-    tab_div_login = render_template("tab_div_login.jinja", login_form=LoginForm())
-    return render_template('login.jinja', login=tab_div_login )
+    return render_template('login.jinja', login_form=LoginForm())
         
 
 @app.route('/news/<symbol>', methods=['GET','POST'])
@@ -104,17 +415,11 @@ def report():
         # Load Data
         ###########################################################
         
-        # Recreate DataModel instance using session data
-        data_model_data = session.get('data_model')
-        if data_model_data is None:
+        # Recreate DataModel instance from the model cache, the session only holds the symbol
+        symbol = session.get('data_model')
+        data_model = loadModel(symbol) if symbol else None
+        if data_model is None:
             return redirect('/search', code=302, Response=None)
-        
-        #data_model = DataModel(config=api_config, symbol=symbol)
-        data_model = DataModel()
-        data_model.profile              = data_model_data['profile']
-        data_model.financials           = data_model_data['financials']
-        data_model.dividend_history     = [Dividend(**d) for d in data_model_data['dividend_history']]
-        data_model.dividend_frequency   = data_model_data['dividend_frequency']
 
         # Init config defaults based on search result and cookie settings
         settings_form = DivCalcForm()
@@ -127,12 +432,10 @@ def report():
         settings_form.contribution.data  = request.form.get('contribution')
         settings_form.volatility.data    = request.form.get('volatility')
         settings_form.purchase_mode.data = request.form.get('purchase_mode')          
+        settings_form.engine.data        = request.form.get('engine')
+        settings_form.paths.data         = request.form.get('paths')
+        settings_form.seed.data          = request.form.get('seed')
 
-        tab_div_header  = render_template("tab_div_header.jinja", 
-                                          app_info=app_info)
-        tab_div_calc    = render_template('tab_div_calc.jinja', 
-                                          form = settings_form, 
-                                          data = data_model)
 
         ###########################################################
         # Load Parameters
@@ -140,58 +443,86 @@ def report():
 
         # Form data -> vars for cleaner math
         
-        data_model.config['term']            = int(settings_form.term.data)
-        data_model.config['initial_capital'] = float(settings_form.initial_capital.data)
-        data_model.config['shares_owned']    = float(settings_form.shares_owned.data)
-        data_model.config['contribution']    = float(settings_form.contribution.data)
-        data_model.config['share_price']     = float(settings_form.share_price.data)
-        data_model.config['volatility']      = float(settings_form.volatility.data)
-        data_model.config['distribution']    = float(settings_form.distribution.data)
+        try:
+            data_model.config['term']            = int(settings_form.term.data)
+            data_model.config['initial_capital'] = float(settings_form.initial_capital.data)
+            data_model.config['shares_owned']    = float(settings_form.shares_owned.data)
+            data_model.config['contribution']    = float(settings_form.contribution.data)
+            data_model.config['share_price']     = float(settings_form.share_price.data)
+            data_model.config['volatility']      = float(settings_form.volatility.data)
+            data_model.config['distribution']    = float(settings_form.distribution.data)
+            data_model.config['seed']            = int(settings_form.seed.data) if settings_form.seed.data else None
+        except (TypeError, ValueError):
+            return reportFormError(data_model, settings_form, 'Every field needs a number, term and seed whole ones')
         data_model.config['purchase_mode']   = settings_form.purchase_mode.data
         data_model.config['frequency']       = settings_form.frequency.data
+        data_model.config['engine']          = settings_form.engine.data
+        data_model.config['paths']           = pathsValue(settings_form.paths.data)
+
+        # Same bounds as the JSON routes, a long volatile term holds paths x periods
+        error = configValueError(data_model.config)
+        if error:
+            return reportFormError(data_model, settings_form, error)
+
+        # Volatile runs draw from a seed, picked here when none was given so the
+        # exports linked from the report (which rerun this config) match the page
+        if data_model.config['volatility'] > 0 and data_model.config['seed'] is None:
+            data_model.config['seed'] = secrets.randbits(32)
+
+        # Exports linked from the report rerun this config
+        session['report_config'] = dict(data_model.config)
         
         # Calculate dividend
         calc = Calculator(data_model)
-        calc.run()
-        
-        tab_div_summary = render_template('tab_div_summary.jinja', totals=calc.totals, model=data_model, frequency=calc.config['frequency'])
-        tab_div_report  = render_template('tab_div_report_rows.jinja', report=calc.report)
-        
+
         ###################################
-        # Roll up chart data
+        # Run while streaming
         ###################################
-        
-        # Simulation chart
-        i = len(calc.report)
-        cols = [i for i in range(1, i +1)]
-        income = [float(r.get('income').replace('$','').replace(',','')) for r in calc.report]
-        assets = [r.get('asset_value') for r in calc.report]
-        price  = [r.get('share_price') for r in calc.report]
-        tab_div_chart_sim = render_template('tab_div_chart_sim.jinja',
-                                labels = cols, 
-                                income = income,
-                                assets = assets,
-                                price  = price,
-                                frequency = data_model.config['frequency'],
-                                )        
-
-        # Render page with widgets
-        return render_template('report.jinja', 
-                                header     = tab_div_header,        # Widget
-                                config     = tab_div_calc,          # Widget
-                                summary    = tab_div_summary,       # Widget
-                                chart_sim  = tab_div_chart_sim,     # Widget
-                                report     = tab_div_report,        # Widget
+
+        # Called by the page after the header and config are on the wire,
+        # the chart and summary widgets render from what it returns
+        def simulate():
+            with divcalc_metrics.timed('calc'):
+                calc.run()
+
+                # Volatile runs also get Monte Carlo percentile bands for the chart
+                bands = None
+                if data_model.config['volatility'] > 0:
+                    calc.runMonteCarlo()
+                    bands = {
+                        'income' : [b.round(4).tolist() for b in calc.bands['income']],
+                        'assets' : [b.round(2).tolist() for b in calc.bands['asset_value']],
+                    }
+
+            return {
+                'labels' : calc.report.period.tolist(),
+                'income' : calc.report.income.round(2).tolist(),
+                'assets' : calc.report.asset_value.tolist(),
+                'price'  : calc.report.share_price.tolist(),
+                'bands'  : bands,
+                'totals' : calc.totals,
+            }
+
+        # Stream the page and its widgets in one pass, report rows are rendered one at a time straight off the calculator
+        return Response(chunked(stream_template('report.jinja',
+                                app_info   = app_info,
+                                form       = settings_form,         # Config widget
+                                data       = data_model,            # Config widget
+                                simulate   = simulate,              # Chart and summary widgets, run lazily
+                                frequency  = data_model.config['frequency'],
+                                report     = calc.rows(),           # Data, generator
                                 model      = data_model,            # Data
-                                ), 200, {'ContentType':'text/html; charset=utf-8'}
+                                )), 200, mimetype='text/html')
         
 @app.route('/search', methods=['POST'])
 def search():
 
     if request.method == 'POST':
 
-        # API data filtering key
-        symbol = request.form.get('stock_symbol').upper()
+        # API data filtering key, rendered into the page and kept in the session history
+        symbol = (request.form.get('stock_symbol') or '').upper()
+        if not divcalc_prices.validSymbol(symbol):
+            return render_template('error.jinja', msg='<p> Invalid symbol</p>', app_info=app_info), 400
         
         # Confirm data source
         api_config = {
@@ -204,35 +535,33 @@ def search():
         
         # Search and build stock profile
         data_model = DataModel()
-        data_model.getData(config=api_config, symbol=symbol)
+        try:
+            data_model.getData(config=api_config, symbol=symbol)
+        except divcalc_data.NoDividendsError:
+            msg = f'<p> No dividend history for {escape(symbol)}, only dividend paying stocks can be simulated</p>'
+            return render_template('error.jinja', msg=msg, app_info=app_info), 404
         
         
         # No records returned on profile, error out
         if data_model.profile.get('stock_symbol') == None:
-            tab_div_header = render_template("tab_div_header.jinja", app_info=app_info)
-
             msg= '''
                 <p> No records matched your search term: {symbol}</p>
                 <p> Only individual stocks are available for research at this time. ETFs, mutual funds, and the like will not appear.</p>
                 <p> If you are unsure, try searching for the company stock with your favorite search engine. Some dividend stocks to try: KO, CVX, UPS, ARR, SHIP</p>            
-            '''.format(symbol=symbol)
-            return render_template('error.jinja', msg=msg, header=tab_div_header)
+            '''.format(symbol=escape(symbol))
+            return render_template('error.jinja', msg=msg, app_info=app_info)
 
         # Record found, fetch all data, build form, add valid data to session
         else:
             
-            # Store necessary data in the session
-            session['data_model'] = {
-                'profile'           : data_model.profile,
-                'financials'        : data_model.financials,
-                'dividend_history'  : [d.__dict__ for d in data_model.dividend_history],
-                'dividend_frequency': data_model.dividend_frequency
-            }            
-            # Update session stock search history
-            if 'stock_history' in session and session['stock_history'] is not None:
-                session['stock_history'].appendleft(symbol)
-            else:
-                session['stock_history'] = deque([symbol], maxlen=5)
+            # Cache the model, the session only references it by symbol
+            model_cache.set((api_config['api_src'], symbol), data_model.toDict(), model_ttl)
+            session['data_model'] = symbol
+            # Update session stock search history, newest first, last 5
+            session['stock_history'] = ([symbol] + list(session.get('stock_history') or []))[:5]
+            # Searched symbols stay warm for the next search, from any session
+            if divcalc_watch.enabled:
+                divcalc_watch.watchlist.touch(symbol)
             
             # Init config defaults based on search result and cookie settings
             settings_form = DivCalcForm()
@@ -270,36 +599,358 @@ def search():
             settings_form.volatility.data    = Decimal(data_model.financials['beta'])
 
             # Chart Axes
-            div_dates = []
-            div_amounts = []
-            
-            for d in data_model.dividend_history[::-1]:
-                div_dates.append(d.payment_date)
-                div_amounts.append(d.amount)
+            div_dates, div_amounts = dividendChart(data_model)
                 
-            # Create page widgets
-            tab_div_header = render_template("tab_div_header.jinja", app_info=app_info)
-            tab_div_profile = render_template('tab_div_profile.jinja',   model=data_model)
-            tab_div_finance = render_template('tab_div_financial.jinja', model=data_model)
-            tab_div_history = render_template('tab_div_history.jinja',   model=data_model)
-            tab_div_chart   = render_template('tab_div_chart_hist.jinja', 
-                                               div_dates   = div_dates,
-                                               div_amounts = div_amounts
-                                               )
-            tab_div_calc    = render_template('tab_div_calc.jinja',
-                                              form=settings_form,
-                                              data=data_model
-                                              )
-            # Render page with widgets
+            # Render page and widgets in one pass
             return render_template('search.jinja', 
-                                   header   = tab_div_header, 
-                                   profile  = tab_div_profile, 
-                                   finance  = tab_div_finance,
-                                   history  = tab_div_history,
-                                   settings = tab_div_calc,
-                                   chart    = tab_div_chart
+                                   app_info    = app_info,
+                                   model       = data_model,        # Profile, financial and history widgets
+                                   form        = settings_form,     # Calc widget
+                                   data        = data_model,        # Calc widget
+                                   div_dates   = div_dates,         # Chart widget
+                                   div_amounts = div_amounts        # Chart widget
                                    ), 200, {'ContentType':'text/html; charset=utf-8'}
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    # Cache and pool counters for sizing, JSON only
+    return {
+        'responses' : divcalc_api.response_cache.stats(),
+        'models'    : model_cache.stats(),
+        'results'   : divcalc_data.result_cache.stats(),
+        'upstream'  : divcalc_api.poolStats(),
+        'prices'    : divcalc_prices.price_cache.stats(),
+        'watch'     : divcalc_watch.stats() if divcalc_watch.enabled else None,
+    }
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition of this process' request and stage timings
+    if not divcalc_metrics.enabled:
+        return {'error': 'Metrics are disabled, set DIVCALC_METRICS=1'}, 404
+    exposition = divcalc_metrics.exposition()
+    if divcalc_watch.enabled:
+        exposition += divcalc_watch.exposition()
+    return Response(exposition, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/watchlist', methods=['GET', 'POST'])
+@csrf.exempt
+def api_watchlist():
+
+    ###########################################################
+    # Symbols kept warm by the refresh thread. Searches add to it,
+    # pinned symbols never expire:
+    #   {"pin": ["KO", "PEP"], "remove": ["XOM"]}
+    ###########################################################
+    if not divcalc_watch.enabled:
+        return {'error': 'Watchlist refresh is disabled, set DIVCALC_WATCH_API_KEY'}, 404
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return {'error': 'Expected {"pin": [...], "remove": [...]}'}, 400
+        pin = [str(s).upper() for s in payload.get('pin') or []]
+        remove = [str(s).upper() for s in payload.get('remove') or []]
+        if not all(divcalc_prices.validSymbol(s) for s in pin + remove):
+            return {'error': 'Invalid symbol'}, 400
+        divcalc_watch.watchlist.pin(pin)
+        divcalc_watch.watchlist.pin(remove, pin=False)
+    return dict(divcalc_watch.stats(), watchlist=sorted(divcalc_watch.watchlist.entries(), key=lambda e: e['symbol']))
+
+@app.route('/sweep', methods=['POST'])
+@csrf.exempt
+def sweep():
+
+    ###########################################################
+    # Scenario grid: {"config": {...}, "grid": {"term": [...], ...}}
+    ###########################################################
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('config', {}), dict) or not isinstance(payload.get('grid'), dict):
+        return {'error': 'Expected {"config": {...}, "grid": {...}}'}, 400
+    base_config = payload.get('config', {})
+    grid = payload['grid']
+    chunksize = payload.get('chunksize')
+
+    unknown, missing = configErrors(list(base_config) + list(grid), list(base_config) + list(grid))
+    if unknown or missing:
+        return {'error': 'Invalid sweep config', 'unknown': unknown, 'missing': missing}, 400
+    if not grid or not all(isinstance(v, list) and v for v in grid.values()):
+        return {'error': 'Grid values must be non-empty lists'}, 400
+    if chunksize is not None and not (isWhole(chunksize) and chunksize > 0):
+        return {'error': 'chunksize must be a positive whole number'}, 400
+    if divcalc_sweep.gridSize(grid) > divcalc_sweep.max_scenarios:
+        return {'error': f'A sweep runs at most {divcalc_sweep.max_scenarios} scenarios'}, 400
+
+    # Every grid value on top of the base config, once the 200 is out errors can only go in the stream
+    error = configValueError(base_config)
+    for key, values in grid.items():
+        for value in values:
+            error = error or configValueError(dict(base_config, **{key: value}))
+    if error:
+        return {'error': error}, 400
+
+    # Stream one NDJSON line per completed chunk: header first, then rows in completion order
+    def generate():
+        yield json.dumps({
+            'scenarios' : divcalc_sweep.gridSize(grid),
+            'grid'      : list(grid),
+            'columns'   : divcalc_sweep.summary_columns,
+        }) + '\n'
+        try:
+            for start, rows in divcalc_sweep.sweep(base_config, grid, chunksize):
+                yield json.dumps({'start': start, 'rows': rows}) + '\n'
+        except Exception:
+            # A chunk raised, end the stream with an error line rather than cutting it short
+            app.logger.exception('Sweep chunk failed')
+            yield json.dumps({'error': 'Sweep failed, results are incomplete'}) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/goal', methods=['POST'])
+@csrf.exempt
+def goal():
+
+    ###########################################################
+    # Goal seek: {"config": {...}, "solve_for": "contribution",
+    #             "target": "income_annual", "goal": 12000, "percentile": 50}
+    ###########################################################
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('config', {}), dict):
+        return {'error': 'Expected {"config": {...}, "solve_for": ..., "target": ..., "goal": ...}'}, 400
+    config = payload.get('config', {})
+    solve_for = payload.get('solve_for')
+    target = payload.get('target')
+    goal_value = payload.get('goal')
+    percentile = payload.get('percentile', 50)
+
+    if solve_for not in divcalc_goal.solve_params or target not in divcalc_goal.solve_targets:
+        return {'error': 'Invalid goal', 'solve_for': divcalc_goal.solve_params, 'target': divcalc_goal.solve_targets}, 400
+    if not isNumber(goal_value) or goal_value <= 0 or not isNumber(percentile) or not 0 <= percentile <= 100:
+        return {'error': 'goal must be a positive number and percentile within 0-100'}, 400
+
+    unknown, missing = configErrors(config, list(config) + [solve_for])
+    if unknown or missing:
+        return {'error': 'Invalid goal config', 'unknown': unknown, 'missing': missing}, 400
+    # The solver picks solve_for, any valid value stands in for it here
+    error = configValueError(dict(config, **{solve_for: 1}))
+    if error:
+        return {'error': error}, 400
+
+    try:
+        with divcalc_metrics.timed('calc'):
+            return divcalc_goal.solve(config, solve_for, target, goal_value, percentile)
+    except divcalc_goal.GoalError as e:
+        return {'error': str(e)}, 400
+
+@app.route('/api/simulate', methods=['POST'])
+@csrf.exempt
+def api_simulate():
+
+    ###########################################################
+    # Headless simulation, no session and no templates.
+    # One item or an array of items:
+    #   {"config": {...}, "symbol": "KO", "api_key": "...", "series": true}
+    # A symbol fills share_price, distribution, volatility and
+    # frequency the config leaves out, from the model cache or,
+    # with an api_key, from AlphaVantage
+    ###########################################################
+    payload = request.get_json(silent=True)
+    batch = isinstance(payload, list)
+    items = payload if batch else [payload]
+    if not items or len(items) > divcalc_simulate.max_batch or not all(isinstance(i, dict) for i in items):
+        return {'error': f'Expected an object or an array of 1-{divcalc_simulate.max_batch} objects'}, 400
+
+    # One calc stage for the whole batch, a stage per item would blow up the Server-Timing header
+    results = []
+    loads = 0
+    series_periods = 0
+    with divcalc_metrics.timed('calc'):
+        for item in items:
+            config = item.get('config') or {}
+            symbol = item.get('symbol') or ''
+            if not isinstance(config, dict):
+                results.append({'error': 'config must be an object'})
+                continue
+            if not isinstance(symbol, str) or symbol and not divcalc_prices.validSymbol(symbol):
+                results.append({'error': 'Invalid symbol'})
+                continue
+
+            config = dict(config)
+            symbol = symbol.upper()
+            if symbol:
+                # Cache first, upstream only while the request has loads left
+                data_model = loadModel(symbol, 'AlphaVantage')
+                if data_model is None and item.get('api_key'):
+                    if loads == divcalc_simulate.max_symbol_loads:
+                        results.append({'error': f'No data for {symbol}, a request loads at most '
+                                                 f'{divcalc_simulate.max_symbol_loads} uncached symbols'})
+                        continue
+                    loads += 1
+                    data_model, failure = apiModel(symbol, item.get('api_key'))
+                    if failure:
+                        results.append(failure[0])
+                        continue
+                    if data_model is None:
+                        results.append({'error': f'No data for {symbol}'})
+                        continue
+                if data_model is None:
+                    results.append({'error': f'No data for {symbol}, not cached and no api_key given'})
+                    continue
+                config = dict(divcalc_simulate.symbolDefaults(data_model), **config)
+
+            unknown, missing = configErrors(config, config)
+            if unknown or missing:
+                results.append({'error': 'Invalid config', 'unknown': unknown, 'missing': missing})
+                continue
+            error = configValueError(config)
+            if error:
+                results.append({'error': error})
+                continue
+
+            # Series grow the response with every period, totals don't
+            series = item.get('series', True)
+            if series:
+                periods = config['term'] * divcalc_data.frequency_map[config['frequency']]
+                if series_periods + periods > divcalc_simulate.max_series_periods:
+                    results.append({'error': f'A request returns at most {divcalc_simulate.max_series_periods} '
+                                             f'series periods, ask for "series": false'})
+                    continue
+                series_periods += periods
+            results.append(divcalc_simulate.simulate(config, series=series))
+
+    if batch:
+        return results
+    if 'error' in results[0]:
+        return results[0], 400
+    return results[0]
+
+@app.route('/api/portfolio', methods=['POST'])
+@csrf.exempt
+def api_portfolio():
+
+    ###########################################################
+    # Many holdings on one monthly timeline, no session:
+    #   {"term": 40, "seed": 1, "series": true, "api_key": "...",
+    #    "holdings": [{"symbol": "KO", "contribution": 100, ...}, ...]}
+    # A symbol fills share_price, distribution, volatility and
+    # frequency the holding leaves out, like /api/simulate
+    ###########################################################
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('holdings'), list):
+        return {'error': 'Expected {"term": ..., "holdings": [...]}'}, 400
+    try:
+        divcalc_portfolio.checkRequest(payload['holdings'], payload.get('term'), payload.get('seed'))
+    except divcalc_portfolio.PortfolioError as e:
+        return {'error': str(e)}, 400
+
+    # Symbols from the model cache first, upstream only while the request has loads left
+    holdings = []
+    loads = 0
+    for i, holding in enumerate(payload['holdings']):
+        if isinstance(holding, dict) and holding.get('symbol'):
+            symbol = holding['symbol']
+            if not isinstance(symbol, str) or not divcalc_prices.validSymbol(symbol):
+                return {'error': f'Holding {i}: invalid symbol'}, 400
+            symbol = symbol.upper()
+            data_model = loadModel(symbol, 'AlphaVantage')
+            if data_model is None and payload.get('api_key'):
+                if loads == divcalc_simulate.max_symbol_loads:
+                    return {'error': f'A request loads at most {divcalc_simulate.max_symbol_loads} uncached symbols'}, 400
+                loads += 1
+                data_model, failure = apiModel(symbol, payload.get('api_key'))
+                if failure:
+                    return failure
+                if data_model is None:
+                    return {'error': f'No data for {symbol}'}, 404
+            if data_model is None:
+                return {'error': f'No data for {symbol}, not cached and no api_key given'}, 400
+            holding = dict(divcalc_simulate.symbolDefaults(data_model), **holding)
+        holdings.append(holding)
+
+    try:
+        with divcalc_metrics.timed('calc'):
+            return divcalc_portfolio.simulate(holdings, payload.get('term'), payload.get('seed'), payload.get('series', True))
+    except divcalc_portfolio.PortfolioError as e:
+        return {'error': str(e)}, 400
+
+@app.route('/api/search', methods=['POST'])
+@csrf.exempt
+def api_search():
+
+    ###########################################################
+    # Headless search: {"symbol": "KO", "api_key": "..."} -> the
+    # cached model (profile, financials, dividend history and
+    # analytics). divcalc_asgi serves this path without a thread
+    ###########################################################
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {'error': 'Expected {"symbol": ..., "api_key": ...}'}, 400
+    symbol = str(payload.get('symbol') or '').upper()
+    if not divcalc_prices.validSymbol(symbol):
+        return {'error': 'Invalid symbol'}, 400
+    api_key = payload.get('api_key')
+    # Same statuses as divcalc_asgi.apiSearch
+    try:
+        data_model = loadModel(symbol, 'AlphaVantage', api_key)
+    except divcalc_data.NoDividendsError as e:
+        return {'error': str(e)}, 404
+    except Exception:
+        app.logger.exception('Search upstream failed')
+        return {'error': 'Upstream request failed'}, 502
+    if data_model is None and api_key is None:
+        return {'error': f'No data for {symbol}, not cached and no api_key given'}, 400
+    if data_model is None:
+        return {'error': f'No data for {symbol}'}, 404
+    return data_model.toDict()
+
+@app.route('/api/backtest', methods=['POST'])
+@csrf.exempt
+def api_backtest():
+
+    ###########################################################
+    # Historical replay of a symbol's real dividends, no session:
+    #   {"symbol": "KO", "api_key": "...", "start": "2000-01-03" or "term": 20,
+    #    "end": "2020-12-31", "initial_capital": 10000, "contribution": 100,
+    #    "purchase_mode": "Fractional", "series": false}
+    # Daily closes come from the price cache, refreshed with the api_key
+    ###########################################################
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {'error': 'Expected {"symbol": ..., "start": ... or "term": ...}'}, 400
+    symbol = str(payload.get('symbol') or '').upper()
+    if not divcalc_prices.validSymbol(symbol):
+        return {'error': 'Invalid symbol'}, 400
+
+    api_key = payload.get('api_key') or None
+    data_model, failure = apiModel(symbol, api_key)
+    if failure:
+        return failure
+    try:
+        prices = divcalc_prices.price_cache.prices(symbol, divcalc_api.AlphaVantage(api_key) if api_key else None)
+    except Exception:
+        app.logger.exception('Price history upstream failed')
+        return {'error': f'Upstream request failed for {symbol}'}, 502
+    if api_key is None and (data_model is None or prices is None):
+        return {'error': f'No data for {symbol}, not cached and no api_key given'}, 400
+    if data_model is None:
+        return {'error': f'No data for {symbol}'}, 404
+    if prices is None:
+        return {'error': f'No price history for {symbol}, TIME_SERIES_DAILY full history may need a premium key'}, 404
+    dividends = data_model.dividend_history
+    divcalc_prices.attachPrices(dividends, prices)
+
+    start = payload.get('start')
+    term = payload.get('term')
+    try:
+        if start is None and term is not None:
+            start = divcalc_backtest.startDate(prices, term)
+        with divcalc_metrics.timed('calc'):
+            return divcalc_backtest.backtest(dividends, prices, start, payload.get('end'),
+                                             payload.get('initial_capital', 0.0), payload.get('shares_owned', 0.0),
+                                             payload.get('contribution', 0.0), payload.get('purchase_mode', 'Fractional'),
+                                             payload.get('series', False))
+    except divcalc_backtest.BacktestError as e:
+        return {'error': str(e)}, 400
+
 @app.route('/settings', methods=['GET','POST'])
 def settings():
 
@@ -332,14 +983,11 @@ def settings():
         if session['purchase_mode'] != None:
             settings_form.purchase_mode.data = session['purchase_mode']
     
-        # Render widgets 
-        tab_div_header = render_template("tab_div_header.jinja", app_info=app_info)
-        tab_div_settings = render_template('tab_div_settings.jinja', 
-                                           settings=settings_form, 
-                                           api_settings=api_settings_form)
+        # Render page and widgets
         settings_page    = render_template('settings.jinja',
-                                           header=tab_div_header,
-                                           content=tab_div_settings
+                                           app_info=app_info,
+                                           settings=settings_form, 
+                                           api_settings=api_settings_form
                                            ), 200, {'ContentType':'text/html; charset=utf-8'} 
         return settings_page
     
@@ -375,15 +1023,11 @@ def settings():
         stock_settings_form.purchase_mode.data = request.form.get('purchase_mode')
         session['purchase_mode'] = stock_settings_form.purchase_mode.data
                 
-        # Render widget(s)
-        tab_div_header = render_template("tab_div_header.jinja", app_info=app_info)
-        tab_div_settings = render_template('tab_div_settings.jinja', 
-                                           settings=stock_settings_form, 
-                                           api_settings=api_settings_form)
-        # Render page
+        # Render page and widget(s)
         settings_page    = render_template('settings.jinja',
-                                           header=tab_div_header,
-                                           content=tab_div_settings,
+                                           app_info=app_info,
+                                           settings=stock_settings_form, 
+                                           api_settings=api_settings_form,
                                            #api_status = api_status,
                                            ), 200, {'ContentType':'text/html; charset=utf-8'}
         return settings_page
@@ -0,0 +1,46 @@
+import os
+
+from divcalc_data import DataModel, Calculator, Report
+
+###########################################################
+#
+# Headless simulations for the JSON API
+# Totals plus columnar series (one list per report column),
+# totals only runs use the closed form where it applies
+#
+###########################################################
+
+max_batch = int(os.environ.get('DIVCALC_API_BATCH', 10000))
+
+# Symbols one request may fetch from AlphaVantage, each costs several upstream calls.
+# Cached symbols don't count
+max_symbol_loads = int(os.environ.get('DIVCALC_API_SYMBOL_LOADS', 10))
+
+# Series periods one request may return, summed over its items. Each is a value per report column
+max_series_periods = int(os.environ.get('DIVCALC_API_SERIES_PERIODS', 100000))
+
+
+def symbolDefaults(data_model):
+    # Config values a search would put on the form
+    return {
+        'share_price'   : data_model.financials['share_price'],
+        'distribution'  : data_model.financials['dividend'],
+        'volatility'    : data_model.financials['beta'],
+        'frequency'     : data_model.dividend_frequency or 'Quarterly',
+    }
+
+
+def simulate(config, series=True):
+    data_model = DataModel()
+    data_model.config.update(config)
+    calc = Calculator(data_model)
+
+    if not series:
+        calc.runTotals()
+        return {'totals': calc.totals}
+
+    calc.run()
+    return {
+        'totals': calc.totals,
+        'series': {c: getattr(calc.report, c).tolist() for c in Report.columns},
+    }
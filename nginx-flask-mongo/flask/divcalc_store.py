@@ -0,0 +1,110 @@
+import os
+import asyncio
+import datetime
+
+import divcalc_analytics
+import divcalc_api
+import divcalc_cache
+
+###########################################################
+#
+# Persistent dividend history in the compose Mongo service
+# dividends      - one document per (symbol, payment_date)
+# dividend_sync  - per symbol refresh bookkeeping
+# dividend_analytics - per symbol divcalc_analytics record,
+#                  updated with each merge's new payments
+#
+###########################################################
+
+class DividendStore:
+    # Refresh at most this often per symbol. AlphaVantage's DIVIDENDS endpoint
+    # has no date filter, so staying off the wire is the incremental part
+    def __init__(self, refresh_interval=12 * 60 * 60):
+        self.refresh_interval = datetime.timedelta(seconds=refresh_interval)
+        self._db = None
+
+    @property
+    def db(self):
+        # Connect on first use so forked workers each get their own client
+        if self._db is None:
+            db = divcalc_cache.mongoDatabase()
+            db.dividends.create_index([('symbol', 1), ('payment_date', -1)], unique=True)
+            self._db = db
+        return self._db
+
+    def reset(self):
+        self._db = None
+
+    def latest(self, symbol):
+        doc = self.db.dividends.find_one({'symbol': symbol}, sort=[('payment_date', -1)])
+        return doc['payment_date'] if doc else None
+
+    def history(self, symbol):
+        # Newest first, same shape and order as the AlphaVantage payload
+        return list(self.db.dividends.find({'symbol': symbol}, {'_id': False, 'symbol': False})
+                                     .sort('payment_date', -1))
+
+    def merge(self, symbol, records):
+        # Only records newer than what's stored are written
+        latest = self.latest(symbol)
+        newer = [dict(r, symbol=symbol) for r in records
+                 if len(r.get('payment_date', '')) == 10 and (latest is None or r['payment_date'] > latest)]
+        if newer:
+            from pymongo.errors import BulkWriteError
+            try:
+                self.db.dividends.insert_many(newer, ordered=False)
+            except BulkWriteError as e:
+                # Another worker merged the same symbol first, its copies of these rows are kept
+                if e.details.get('writeConcernErrors') or any(err['code'] != 11000 for err in e.details['writeErrors']):
+                    raise
+            # Analytics only fold in payments past their last one, a second merge of the same rows is a no-op
+            analytics = self.db.dividend_analytics.find_one({'_id': symbol}, {'_id': False})
+            if analytics is not None:
+                self.db.dividend_analytics.replace_one({'_id': symbol},
+                                                       divcalc_analytics.updateAnalytics(analytics, newer))
+        return len(newer)
+
+    def analytics(self, symbol):
+        # One _id read, built from the stored history the first time
+        analytics = self.db.dividend_analytics.find_one({'_id': symbol}, {'_id': False})
+        if analytics is None:
+            analytics = divcalc_analytics.analyzeHistory(self.history(symbol))
+            self.db.dividend_analytics.replace_one({'_id': symbol}, analytics, upsert=True)
+        return analytics
+
+    def refresh(self, symbol, api_functions, force=False):
+        # force: the watchlist scheduler checks upstream on its own interval
+        now = datetime.datetime.now(datetime.timezone.utc)
+        sync = None if force else self.db.dividend_sync.find_one({'_id': symbol})
+        if sync is not None and now - sync['checked_at'].replace(tzinfo=datetime.timezone.utc) < self.refresh_interval:
+            return self.history(symbol)
+
+        added = self.merge(symbol, api_functions.getDividendHistory(symbol))
+        self.db.dividend_sync.update_one({'_id': symbol},
+                                         {'$set': {'checked_at': now, 'added': added}},
+                                         upsert=True)
+        return self.history(symbol)
+
+
+# DIVCALC_STORE=mongo turns the store on (compose does), otherwise every search goes upstream
+dividend_store = None
+if os.environ.get('DIVCALC_STORE') == 'mongo':
+    dividend_store = DividendStore(int(os.environ.get('DIVCALC_STORE_REFRESH', 12 * 60 * 60)))
+
+
+def dividendHistory(symbol, api_functions):
+    # (records newest first, analytics)
+    if dividend_store is None:
+        records = api_functions.getDividendHistory(symbol)
+        return records, divcalc_analytics.analyzeHistory(records)
+    records = dividend_store.refresh(symbol, api_functions)
+    return records, dividend_store.analytics(symbol)
+
+
+async def dividendHistoryAsync(symbol, api_functions):
+    # dividendHistory for an AsyncAlphaVantage. The store is pymongo, so that path runs in a
+    # thread with a blocking client, it only goes upstream once per refresh interval
+    if dividend_store is None:
+        records = await api_functions.getDividendHistory(symbol)
+        return records, divcalc_analytics.analyzeHistory(records)
+    return await asyncio.to_thread(dividendHistory, symbol, divcalc_api.AlphaVantage(api_functions.key))
@@ -0,0 +1,96 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from divcalc_data import DataModel, Calculator
+
+###########################################################
+#
+# Parameter sweep over a grid of DataModel.config values
+# Scenarios are fanned out to a process pool in chunks,
+# each chunk returns a compact table of summary totals
+#
+###########################################################
+
+summary_columns = [
+    'periods',
+    'investment_tot',
+    'total_reinvested',
+    'shares_owned',
+    'cash',
+    'ending_assets',
+    'ending_distribution',
+    'income_annual',
+]
+
+# Every gunicorn worker has its own pool, by default they split the cores between them
+workers = int(os.environ.get('DIVCALC_SWEEP_WORKERS', 0)) or max(1, os.cpu_count() // int(os.environ.get('GUNICORN_WORKERS', 1)))
+max_scenarios = int(os.environ.get('DIVCALC_SWEEP_MAX', 100000))
+executor = None
+
+
+def getExecutor():
+    # One pool per process, created on first use so forked workers don't inherit it.
+    # Its processes come from a forkserver: forking a threaded gunicorn worker could
+    # copy a lock some other thread held and deadlock the child on it
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+    return executor
+
+
+def gridSize(grid):
+    size = 1
+    for values in grid.values():
+        size *= len(values)
+    return size
+
+
+def scenario(grid, index):
+    # Decode a flat scenario index into one value per grid key (mixed radix, last key fastest)
+    values = {}
+    for key in reversed(list(grid)):
+        index, i = divmod(index, len(grid[key]))
+        values[key] = grid[key][i]
+    return values
+
+
+def runChunk(base_config, grid, start, stop):
+    # Worker side: only the base config, the grid and an index range cross the process boundary
+    rows = []
+    for index in range(start, stop):
+        data_model = DataModel()
+        data_model.config.update(base_config)
+        data_model.config.update(scenario(grid, index))
+
+        calc = Calculator(data_model)
+        # Only totals are returned, flat price fractional scenarios are solved in closed form.
+        # Sweep scenarios are all distinct, caching them would only churn the result cache
+        calc.runTotals(cache=False)
+        rows.append([calc.totals[c] for c in summary_columns])
+    return start, rows
+
+
+def sweep(base_config, grid, chunksize=None):
+    # Yields (start, rows) as each chunk completes, in completion order
+    size = gridSize(grid)
+    pool = getExecutor()
+    if chunksize is None:
+        # Several chunks per worker keeps the pool busy without paying pickling per scenario
+        chunksize = max(1, min(1000, size // (workers * 8)))
+
+    futures = [pool.submit(runChunk, base_config, grid, start, min(start + chunksize, size))
+               for start in range(0, size, chunksize)]
+    global executor
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    except BrokenProcessPool:
+        # A pool process died, the next sweep starts a fresh pool
+        executor = None
+        raise
+    finally:
+        # Client went away or a chunk failed, drop whatever hasn't started
+        for future in futures:
+            future.cancel()
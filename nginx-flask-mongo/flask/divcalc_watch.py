@@ -0,0 +1,352 @@
+import os
+import time
+import fcntl
+import logging
+import tempfile
+import threading
+
+import divcalc_api
+import divcalc_cache
+import divcalc_store
+
+###########################################################
+#
+# Watchlist refresh: symbols users search (and pinned ones)
+# are kept warm in the response cache and dividend store by
+# one background thread per host, so their searches make no
+# upstream calls. Each endpoint has its own interval and
+# every call goes through a token bucket sized to the
+# AlphaVantage quota. DIVCALC_WATCH_API_KEY turns it on
+#
+###########################################################
+
+api_key = os.environ.get('DIVCALC_WATCH_API_KEY')
+enabled = bool(api_key)
+
+# Seconds between refreshes of each endpoint, per watched symbol
+intervals = {
+    'GLOBAL_QUOTE'      : int(os.environ.get('DIVCALC_WATCH_QUOTE', 5 * 60)),
+    'NEWS_SENTIMENT'    : int(os.environ.get('DIVCALC_WATCH_NEWS', 60 * 60)),
+    'OVERVIEW'          : int(os.environ.get('DIVCALC_WATCH_OVERVIEW', 24 * 60 * 60)),
+    'DIVIDENDS'         : int(os.environ.get('DIVCALC_WATCH_DIVIDENDS', 12 * 60 * 60)),
+}
+symbol_fields = {'NEWS_SENTIMENT': 'tickers'}
+# Refreshed responses stay cached this many intervals, a slow bucket still serves them
+ttl_intervals = 2
+
+# AlphaVantage quota, calls per minute and how many may go back to back
+rate_per_minute = float(os.environ.get('DIVCALC_WATCH_RATE', 5))
+burst = int(os.environ.get('DIVCALC_WATCH_BURST', 5))
+
+max_symbols = int(os.environ.get('DIVCALC_WATCH_SIZE', 50))
+# Searched symbols drop off after this long without a search, pinned ones stay
+search_expiry = int(os.environ.get('DIVCALC_WATCH_EXPIRY', 7 * 24 * 60 * 60))
+pinned = [s.strip().upper() for s in os.environ.get('DIVCALC_WATCHLIST', '').split(',') if s.strip()]
+
+# A refresh that raises is retried after this many seconds, doubling per failure in a row.
+# After max_failures it is marked refreshed and waits out its interval
+retry_seconds = int(os.environ.get('DIVCALC_WATCH_RETRY', 60))
+max_failures = int(os.environ.get('DIVCALC_WATCH_MAX_FAILURES', 3))
+
+# Idle poll, and how often a non-leader process retries the lock
+poll_seconds = 5
+elect_seconds = 30
+lock_path = os.path.join(tempfile.gettempdir(), 'divcalc_watch.lock')
+
+counter_names = tuple(intervals) + ('rate_limited', 'failures')
+
+
+class TokenBucket:
+    # rate tokens per second up to capacity
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, stop):
+        # Blocks until a token is free, False if stop is set while waiting
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                delay = (1 - self.tokens) / self.rate
+            if stop.wait(delay):
+                return False
+
+    def drain(self):
+        # Upstream said slow down, start from empty
+        with self.lock:
+            self.refill()
+            self.tokens = 0.0
+
+
+class MemoryWatchlist:
+    # Single process (dev server), lost on restart
+    def __init__(self):
+        self.watched = {}
+        self.counters = dict.fromkeys(counter_names, 0)
+        self.lock = threading.Lock()
+
+    def touch(self, symbol):
+        now = time.time()
+        with self.lock:
+            entry = self.watched.setdefault(symbol, {'symbol': symbol, 'pinned': False, 'refreshed': {}, 'failed': {}})
+            entry['searched_at'] = now
+            unpinned = sorted((e['searched_at'], s) for s, e in self.watched.items() if not e['pinned'])
+            for _, s in unpinned[:max(0, len(self.watched) - max_symbols)]:
+                del self.watched[s]
+
+    def pin(self, symbols, pin=True):
+        now = time.time()
+        with self.lock:
+            for symbol in symbols:
+                if pin:
+                    entry = self.watched.setdefault(symbol, {'symbol': symbol, 'searched_at': now, 'refreshed': {}, 'failed': {}})
+                    entry['pinned'] = True
+                else:
+                    self.watched.pop(symbol, None)
+
+    def entries(self):
+        expired = time.time() - search_expiry
+        with self.lock:
+            for s in [s for s, e in self.watched.items() if not e['pinned'] and e['searched_at'] < expired]:
+                del self.watched[s]
+            return [dict(e, refreshed=dict(e['refreshed']), failed={f: dict(v) for f, v in e['failed'].items()})
+                    for e in self.watched.values()]
+
+    def refreshed(self, symbol, function, when):
+        with self.lock:
+            if symbol in self.watched:
+                self.watched[symbol]['refreshed'][function] = when
+                self.watched[symbol]['failed'].pop(function, None)
+
+    def failed(self, symbol, function, when):
+        # Failures in a row so far, a refresh starts the count over
+        with self.lock:
+            if symbol not in self.watched:
+                return 0
+            failure = self.watched[symbol]['failed'].setdefault(function, {'count': 0})
+            failure['count'] += 1
+            failure['at'] = when
+            return failure['count']
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def totals(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def reset(self):
+        pass
+
+
+class MongoWatchlist:
+    # Shared by every worker: searches land here from any of them, the
+    # leader's refresh times and call counts are visible to all
+    def __init__(self):
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = divcalc_cache.mongoDatabase()
+        return self._db
+
+    def reset(self):
+        self._db = None
+
+    def touch(self, symbol):
+        now = time.time()
+        self.db.watchlist.update_one({'_id': symbol},
+                                     {'$set': {'searched_at': now},
+                                      '$setOnInsert': {'pinned': False, 'refreshed': {}}},
+                                     upsert=True)
+        excess = self.db.watchlist.count_documents({}) - max_symbols
+        if excess > 0:
+            oldest = self.db.watchlist.find({'pinned': False}, {'_id': True}).sort('searched_at', 1).limit(excess)
+            self.db.watchlist.delete_many({'_id': {'$in': [d['_id'] for d in oldest]}})
+
+    def pin(self, symbols, pin=True):
+        now = time.time()
+        for symbol in symbols:
+            if pin:
+                self.db.watchlist.update_one({'_id': symbol},
+                                             {'$set': {'pinned': True},
+                                              '$setOnInsert': {'searched_at': now, 'refreshed': {}}},
+                                             upsert=True)
+            else:
+                self.db.watchlist.delete_one({'_id': symbol})
+
+    def entries(self):
+        self.db.watchlist.delete_many({'pinned': False, 'searched_at': {'$lt': time.time() - search_expiry}})
+        return [dict(d, symbol=d.pop('_id')) for d in self.db.watchlist.find()]
+
+    def refreshed(self, symbol, function, when):
+        self.db.watchlist.update_one({'_id': symbol}, {'$set': {f'refreshed.{function}': when},
+                                                       '$unset': {f'failed.{function}': ''}})
+
+    def failed(self, symbol, function, when):
+        # return_document=True is ReturnDocument.AFTER
+        doc = self.db.watchlist.find_one_and_update({'_id': symbol},
+                                                    {'$inc': {f'failed.{function}.count': 1},
+                                                     '$set': {f'failed.{function}.at': when}},
+                                                    projection={'failed': True},
+                                                    return_document=True)
+        return doc['failed'][function]['count'] if doc else 0
+
+    def count(self, name):
+        self.db.watch_counters.update_one({'_id': 'calls'}, {'$inc': {name: 1}}, upsert=True)
+
+    def totals(self):
+        doc = self.db.watch_counters.find_one({'_id': 'calls'}) or {}
+        return {name: doc.get(name, 0) for name in counter_names}
+
+
+def lags(entries, now):
+    # Worst seconds past due per endpoint, 0 while the scheduler keeps up
+    lag = dict.fromkeys(intervals, 0.0)
+    for e in entries:
+        for function, interval in intervals.items():
+            # Never refreshed is due from the moment it joined
+            refreshed = e['refreshed'].get(function)
+            due = refreshed + interval if refreshed is not None else e['searched_at']
+            lag[function] = max(lag[function], now - due)
+    return lag
+
+
+class Scheduler:
+    def __init__(self, watchlist, bucket):
+        self.watchlist = watchlist
+        self.bucket = bucket
+        self.stop = threading.Event()
+        self.pid = None
+        self.lock_file = None
+
+    def start(self):
+        # Once per process, from the first request: gunicorn workers fork after import
+        # and threads don't survive the fork. Only the lock holder does any refreshing
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.lock_file = None
+        threading.Thread(target=self.run, name='divcalc-watch', daemon=True).start()
+
+    def elect(self):
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Held until the process exits, then another worker takes over
+        self.lock_file = lock_file
+        self.watchlist.pin(pinned)
+        return True
+
+    def nextDue(self, entries, now):
+        # Most overdue (symbol, endpoint) relative to its interval, so a short
+        # quota delays every endpoint alike instead of starving the slow ones
+        due = None
+        for e in entries:
+            failed = e.get('failed', {})
+            for function, interval in intervals.items():
+                # Failing refreshes wait out their backoff, they'd be the most overdue otherwise
+                failure = failed.get(function)
+                if failure and now < failure['at'] + retry_seconds * 2 ** (failure['count'] - 1):
+                    continue
+                overdue = (now - e['refreshed'].get(function, 0)) / interval
+                if overdue >= 1 and (due is None or overdue > due[0]):
+                    due = (overdue, e['symbol'], function)
+        return due
+
+    def run(self):
+        while not self.stop.is_set():
+            if self.lock_file is None and not self.elect():
+                self.stop.wait(elect_seconds)
+                continue
+            due = None
+            try:
+                due = self.nextDue(self.watchlist.entries(), time.time())
+                if due is None:
+                    self.stop.wait(poll_seconds)
+                    continue
+                if not self.bucket.take(self.stop):
+                    return
+                self.refresh(due[1], due[2])
+            except Exception:
+                logging.exception('Watchlist refresh failed')
+                self.watchlist.count('failures')
+                if due is not None:
+                    self.failed(due[1], due[2])
+                self.stop.wait(poll_seconds)
+
+    def failed(self, symbol, function):
+        if self.watchlist.failed(symbol, function, time.time()) >= max_failures:
+            self.watchlist.refreshed(symbol, function, time.time())
+
+    def refresh(self, symbol, function):
+        api_functions = divcalc_api.AlphaVantage(api_key)
+        d = api_functions.refresh(function, symbol, ttl_intervals * intervals[function], symbol_fields.get(function, 'symbol'))
+        self.watchlist.count(function)
+        if divcalc_api.rateLimited(d):
+            # Quota exhausted, leave it due and back off
+            self.watchlist.count('rate_limited')
+            self.bucket.drain()
+            return
+        # Memoized DIVIDENDS payload, the store merges it without another call
+        if function == 'DIVIDENDS' and divcalc_store.dividend_store is not None and divcalc_api.cacheable(d):
+            divcalc_store.dividend_store.refresh(symbol, api_functions, force=True)
+        # Errors are marked refreshed too, an unknown symbol waits its interval like the rest
+        self.watchlist.refreshed(symbol, function, time.time())
+
+
+watchlist = MongoWatchlist() if divcalc_store.dividend_store is not None else MemoryWatchlist()
+scheduler = Scheduler(watchlist, TokenBucket(rate_per_minute / 60, burst))
+
+
+def stats():
+    entries = watchlist.entries()
+    return {
+        "symbols"           : len(entries),
+        "pinned"            : sum(1 for e in entries if e['pinned']),
+        "leader"            : scheduler.lock_file is not None,
+        "rate_per_minute"   : rate_per_minute,
+        "calls"             : watchlist.totals(),
+        "lag_seconds"       : lags(entries, time.time()),
+    }
+
+
+def exposition():
+    # Shared counters with the mongo watchlist, so every worker reports the same values
+    entries = watchlist.entries()
+    totals = watchlist.totals()
+    lines = ['# HELP divcalc_watch_symbols Symbols on the watchlist',
+             '# TYPE divcalc_watch_symbols gauge',
+             f'divcalc_watch_symbols {len(entries)}',
+             '# HELP divcalc_watch_lag_seconds Worst refresh delay past each endpoint interval',
+             '# TYPE divcalc_watch_lag_seconds gauge']
+    lines += [f'divcalc_watch_lag_seconds{{function="{f}"}} {lag:.1f}' for f, lag in lags(entries, time.time()).items()]
+    lines += ['# HELP divcalc_watch_calls_total Upstream calls made by the watchlist refresh',
+              '# TYPE divcalc_watch_calls_total counter']
+    lines += [f'divcalc_watch_calls_total{{function="{f}"}} {totals[f]}' for f in intervals]
+    lines += ['# HELP divcalc_watch_rate_limited_total Refreshes answered with a rate limit notice',
+              '# TYPE divcalc_watch_rate_limited_total counter',
+              f'divcalc_watch_rate_limited_total {totals["rate_limited"]}',
+              '# HELP divcalc_watch_failures_total Refreshes that raised',
+              '# TYPE divcalc_watch_failures_total counter',
+              f'divcalc_watch_failures_total {totals["failures"]}',
+              '# HELP divcalc_watch_quota_per_minute Configured call budget',
+              '# TYPE divcalc_watch_quota_per_minute gauge',
+              f'divcalc_watch_quota_per_minute {rate_per_minute}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,46 @@
+import os
+import multiprocessing
+
+###########################################################
+#
+# Production serving: gunicorn -c gunicorn.conf.py
+# Every setting can be overridden from the environment
+# Async mode: GUNICORN_APP=divcalc_asgi:app and
+# GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker
+#
+# Reload:  kill -HUP <master>   new workers, config re-read
+# Code changes with preload need a restart (or USR2 then QUIT the old master)
+#
+###########################################################
+
+bind = f"0.0.0.0:{os.environ.get('FLASK_SERVER_PORT', 9090)}"
+
+wsgi_app = os.environ.get('GUNICORN_APP', 'divcalc_server:app')
+
+# Threads cover the AlphaVantage waits, processes cover the numpy work.
+# Uvicorn workers await the waits instead and ignore threads
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# The app sizes its per worker pools (divcalc_sweep) from this
+os.environ['GUNICORN_WORKERS'] = str(workers)
+
+# Import the app once in the master, workers fork with it loaded
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# nginx holds keep-alive connections to us, outlive its upstream keepalive_timeout
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers now and then, staggered so they don't all restart together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def post_fork(server, worker):
+    # Clients created while preloading belong to the master
+    import divcalc_server
+    divcalc_server.afterFork()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The app modules are flat in the directory above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# In-process sessions, the filesystem backend would write into the working directory
+os.environ.setdefault('DIVCALC_SESSION', 'memory')
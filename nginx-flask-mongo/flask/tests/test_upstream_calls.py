@@ -0,0 +1,171 @@
+import json
+import asyncio
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+import divcalc_api
+from divcalc_data import DataModel
+
+###########################################################
+#
+# Upstream calls per search, against a local fake
+# AlphaVantage that counts requests per function
+#
+###########################################################
+
+def payload(function, symbol):
+    if symbol == 'NOPE':
+        # AlphaVantage answers an unknown symbol's overview with an empty object
+        return {} if function == 'OVERVIEW' else {'Error Message': 'Invalid API call'}
+    if symbol.startswith('NODIV') and function == 'DIVIDENDS':
+        return {'symbol': symbol, 'data': []}
+    if function == 'OVERVIEW':
+        return {'Symbol': symbol, 'Name': 'Fake Co', 'Description': '', 'OfficialSite': '', 'Sector': '',
+                'Industry': '', 'Exchange': 'NYSE', 'DividendYield': '0.03', 'AnalystTargetPrice': '70',
+                'BookValue': '6.1', 'Beta': '0.5'}
+    if function == 'DIVIDENDS':
+        return {'symbol': symbol, 'data': [
+            {'ex_dividend_date': f'2024-{m:02d}-01', 'declaration_date': f'2024-{m - 1:02d}-15',
+             'record_date': f'2024-{m:02d}-02', 'payment_date': f'2024-{m:02d}-15', 'amount': '0.50'}
+            for m in (12, 9, 6, 3)]}
+    if function == 'GLOBAL_QUOTE':
+        return {'Global Quote': {'01. symbol': symbol, '05. price': '60.00'}}
+    if function == 'NEWS_SENTIMENT':
+        return {'feed': [{'ticker_sentiment': [{'ticker': symbol, 'ticker_sentiment_score': score}]}
+                         for score in ('0.2', '0.4')]}
+    return {'Error Message': 'Unknown function'}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = Counter()
+    # Responses served ahead of the regular payload, per function. An int is an empty error status
+    calls.queued = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            function = query['function'][0]
+            calls[function] += 1
+            queued = calls.queued.get(function)
+            d = queued.pop(0) if queued else payload(function, (query.get('symbol') or query.get('tickers'))[0])
+            status = 200
+            if isinstance(d, int):
+                status, d = d, {}
+            body = json.dumps(d).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(divcalc_api, 'base_url', f'http://127.0.0.1:{server.server_port}/query')
+    monkeypatch.setattr(divcalc_api, 'rate_limit_backoff', 0)
+    yield calls
+    server.shutdown()
+    server.server_close()
+
+
+def search(symbol):
+    data_model = DataModel()
+    data_model.getData(config={'api_src': 'AlphaVantage', 'api_key': 'test'}, symbol=symbol)
+    return data_model
+
+
+def test_search_fetches_each_endpoint_once(upstream):
+    data_model = search('TSTA')
+    assert data_model.profile['stock_symbol'] == 'TSTA'
+    assert upstream == {'OVERVIEW': 1, 'DIVIDENDS': 1, 'GLOBAL_QUOTE': 1, 'NEWS_SENTIMENT': 1}
+
+
+def test_sentiment_scored_from_the_fetched_feed(upstream):
+    data_model = search('TSTB')
+    assert data_model.sentiment == divcalc_api.sentimentScore(payload('NEWS_SENTIMENT', 'TSTB'), 'TSTB')
+    assert data_model.sentiment.startswith('Somewhat Bullish')
+    assert upstream['NEWS_SENTIMENT'] == 1
+
+
+def test_repeat_search_is_served_from_the_response_cache(upstream):
+    search('TSTC')
+    search('TSTC')
+    assert upstream == {'OVERVIEW': 1, 'DIVIDENDS': 1, 'GLOBAL_QUOTE': 1, 'NEWS_SENTIMENT': 1}
+
+
+def test_unknown_symbol_leaves_an_empty_model(upstream):
+    # All four go out together, the empty overview discards the rest
+    data_model = search('NOPE')
+    assert data_model.profile['stock_symbol'] is None
+    assert upstream == {'OVERVIEW': 1, 'DIVIDENDS': 1, 'GLOBAL_QUOTE': 1, 'NEWS_SENTIMENT': 1}
+
+
+def test_rate_limit_notices_are_retried(upstream):
+    upstream.queued['GLOBAL_QUOTE'] = [{'Note': 'Our standard API call frequency is 5 calls per minute'},
+                                       {'Information': 'Please consider spreading out your free API requests, '
+                                                       'our standard API rate limit is 25 requests per day'}]
+    assert divcalc_api.AlphaVantage('test').getQuote('TSTD')['05. price'] == '60.00'
+    assert upstream['GLOBAL_QUOTE'] == 3
+
+
+def test_other_information_notices_are_not_retried(upstream):
+    upstream.queued['GLOBAL_QUOTE'] = [{'Information': 'This is a premium endpoint'}]
+    assert divcalc_api.AlphaVantage('test').query('GLOBAL_QUOTE', 'TSTE') == {'Information': 'This is a premium endpoint'}
+    assert upstream['GLOBAL_QUOTE'] == 1
+
+
+###########################################################
+# /api/search failures, the Flask view and the ASGI route
+# answer with the same statuses
+###########################################################
+
+def flaskSearch(body):
+    import divcalc_server
+    response = divcalc_server.app.test_client().post('/api/search', json=body)
+    return response.status_code, response.get_json()
+
+
+def asgiSearch(body):
+    import divcalc_asgi
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': json.dumps(body).encode(), 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    async def call():
+        # The async client belongs to this event loop, close it with it
+        try:
+            await divcalc_asgi.app({'type': 'http', 'method': 'POST', 'path': '/api/search', 'headers': []}, receive, send)
+        finally:
+            await divcalc_api.closeAsyncClient()
+
+    asyncio.run(call())
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+@pytest.mark.parametrize('post', [flaskSearch, asgiSearch])
+def test_api_search_without_dividend_history_is_not_found(upstream, post):
+    symbol = f'NODIV{post.__name__[0].upper()}'
+    status, body = post({'symbol': symbol, 'api_key': 'test'})
+    assert status == 404
+    assert body == {'error': f'No dividend history for {symbol}'}
+
+
+@pytest.mark.parametrize('post', [flaskSearch, asgiSearch])
+def test_api_search_upstream_failure_is_a_bad_gateway(upstream, post):
+    upstream.queued['GLOBAL_QUOTE'] = [404]
+    status, body = post({'symbol': f'TSTF{post.__name__[0].upper()}', 'api_key': 'test'})
+    assert status == 502
+    assert body == {'error': 'Upstream request failed'}